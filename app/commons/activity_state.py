@@ -0,0 +1,109 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import base64
+import datetime
+import json
+import logging
+import zlib
+from collections import namedtuple
+
+from app.commons.activity_transitions import Transition
+
+logger = logging.getLogger("metricsGatherer.activity_state")
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+ActivityState = namedtuple("ActivityState", ["last_activity_id", "window_start", "transitions"])
+
+
+def encode_transitions(transitions):
+    rows = [[transition.id, transition.object_id, transition.action, transition.new_value,
+             transition.old_value, transition.creation_date.isoformat(), transition.launch_id]
+            for transition in transitions]
+    return base64.b64encode(zlib.compress(
+        json.dumps(rows, separators=(",", ":")).encode("utf-8"))).decode("ascii")
+
+
+def decode_transitions(data):
+    rows = json.loads(zlib.decompress(base64.b64decode(data)).decode("utf-8"))
+    return [Transition(row[0], row[1], row[2], row[3], row[4], datetime.datetime.fromisoformat(row[5]),
+                       row[6] if len(row) > 6 else None) for row in rows]
+
+
+class ActivityStateStore:
+    """Keeps per project the id of the last read activity and the transitions of the trailing week"""
+
+    def __init__(self, es_client, writer=None):
+        self.es_client = es_client
+        self.writer = writer or es_client
+
+    def load(self, project_id):
+        try:
+            res = self.es_client.es_client.get(self.es_client.activity_state_index, id=str(project_id))
+            source = res["_source"]
+            return ActivityState(
+                source["last_activity_id"],
+                datetime.datetime.strptime(source["window_start"], DATETIME_FORMAT),
+                decode_transitions(source["transitions"]))
+        except Exception as err:
+            logger.debug("No saved activity state for project %s: %s", project_id, err)
+            return None
+
+    def save(self, project_id, state):
+        self.writer.bulk_index(self.es_client.activity_state_index, [{
+            "_id": str(project_id),
+            "_index": self.es_client.activity_state_index,
+            "_source": {
+                "project_id": project_id,
+                "last_activity_id": state.last_activity_id,
+                "window_start": state.window_start.strftime(DATETIME_FORMAT),
+                "gather_datetime": datetime.datetime.now().strftime(DATETIME_FORMAT),
+                "transitions": encode_transitions(state.transitions)
+            }
+        }])
+
+
+class TransitionsRecorder:
+    """Passes transitions through, remembering the ones which are needed for the next run"""
+
+    def __init__(self, transitions, keep_from, last_activity_id=None):
+        self.transitions = transitions
+        self.keep_from = keep_from
+        self.last_activity_id = last_activity_id
+        self.recorded = []
+        self.finished = False
+        self.failed = False
+
+    def __iter__(self):
+        try:
+            for transition in self.transitions:
+                if transition.creation_date >= self.keep_from:
+                    self.recorded.append(transition)
+                if transition.id is not None and (
+                        self.last_activity_id is None or transition.id > self.last_activity_id):
+                    self.last_activity_id = transition.id
+                yield transition
+        except Exception:
+            self.failed = True
+            raise
+        self.finished = True
+
+    @property
+    def completed(self):
+        """Whether all transitions were read without errors, only then the state can be saved"""
+        return self.finished and not self.failed
+
+    def get_state(self):
+        return ActivityState(self.last_activity_id, self.keep_from, self.recorded)
@@ -0,0 +1,51 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import namedtuple
+
+ANALYZE_ITEM = "analyzeItem"
+UPDATE_ITEM = "updateItem"
+UPDATE_ANALYZER = "updateAnalyzer"
+
+ISSUE_TYPE_FIELD = "issueType"
+AUTO_ANALYZER_FIELD = "analyzer.isAutoAnalyzerEnabled"
+
+TRACKED_FIELDS = {
+    ANALYZE_ITEM: ISSUE_TYPE_FIELD,
+    UPDATE_ITEM: ISSUE_TYPE_FIELD,
+    UPDATE_ANALYZER: AUTO_ANALYZER_FIELD,
+}
+
+
+class Transition(namedtuple("Transition", ["id", "object_id", "action", "new_value", "old_value",
+                                           "creation_date", "launch_id"], defaults=[None])):
+    """A change of an item issue type or of the project auto-analysis state taken from an activity"""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+
+def extract_transitions(activities):
+    """Yield the tracked changes from the history of activity rows, other activities are skipped"""
+    for record in activities:
+        field = TRACKED_FIELDS.get(record["action"])
+        if field is None:
+            continue
+        for change in record["details"]["history"]:
+            if change["field"] == field:
+                yield Transition(record.get("id"), record.get("object_id"), record["action"],
+                                 change.get("newValue"), change.get("oldValue"), record.get("creation_date"))
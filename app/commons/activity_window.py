@@ -0,0 +1,50 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import deque
+
+
+class ActivityWindow:
+    """Sliding window over activity rows ordered by creation date.
+
+    The rows are read from the source only once: each slide drops the rows which are older than
+    the new window start and reads the rows up to the new window end, so the window can only
+    move forward in time.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._window = deque()
+        self._next_row = None
+
+    def slide(self, start_date, end_date):
+        while self._window and self._window[0]["creation_date"] < start_date:
+            self._window.popleft()
+        while True:
+            if self._next_row is None:
+                self._next_row = next(self._rows, None)
+                if self._next_row is None:
+                    break
+            if self._next_row["creation_date"] > end_date:
+                break
+            if self._next_row["creation_date"] >= start_date:
+                self._window.append(self._next_row)
+            self._next_row = None
+        return list(self._window)
+
+    def close(self):
+        if hasattr(self._rows, "close"):
+            self._rows.close()
+        self._window.clear()
+        self._next_row = None
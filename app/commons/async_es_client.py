@@ -0,0 +1,96 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.commons import es_client
+from app.utils.async_utils import run_in_executor
+
+logger = logging.getLogger("metricsGatherer.async_es_client")
+
+
+class AsyncEsClient:
+    """Asyncio interface to EsClient.
+
+    The pinned elasticsearch client has no asyncio transport, so every request runs in a worker thread
+    over the shared connection pool of the cluster. The number of workers bounds how many requests
+    run at the same time.
+    """
+
+    def __init__(self, app_config, client=None):
+        self.app_config = app_config
+        self.es_client = client if client is not None else es_client.EsClient(
+            esHost=app_config["esHost"], grafanaHost=app_config["grafanaHost"], app_config=app_config)
+        self.concurrency = max(int(app_config["esAsyncConcurrency"]), 1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # the workers are started on the first request, so the object can be used again after close
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="es_client")
+            return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking call, which sends requests to Elasticsearch, in one of the workers"""
+        return await run_in_executor(self._get_executor(), func, *args, **kwargs)
+
+    async def is_healthy(self):
+        return await self.run(self.es_client.is_healthy)
+
+    async def index_exists(self, index_name, print_error=True):
+        return await self.run(self.es_client.index_exists, index_name, print_error=print_error)
+
+    async def object_exists(self, index_name, row_id):
+        return await self.run(self.es_client.object_exists, index_name, row_id)
+
+    async def get_existing_ids(self, index_name, ids, batch_size=1000):
+        return await self.run(self.es_client.get_existing_ids, index_name, list(ids), batch_size=batch_size)
+
+    async def bulk_index(self, index_name, bulk_actions, refresh=True):
+        return await self.run(self.es_client.bulk_index, index_name, bulk_actions, refresh=refresh)
+
+    async def refresh_index(self, index_name):
+        return await self.run(self.es_client.refresh_index, index_name)
+
+    async def is_the_date_metrics_calculated(self, date):
+        return await self.run(self.es_client.is_the_date_metrics_calculated, date)
+
+    async def get_activities(self, project_id, week_earlier, cur_tommorow, page_size=1000):
+        activities = self.es_client.get_activities(project_id, week_earlier, cur_tommorow, page_size=page_size)
+        try:
+            while True:
+                batch = await self.run(list, itertools.islice(activities, page_size))
+                for activity in batch:
+                    yield activity
+                if len(batch) < page_size:
+                    break
+        finally:
+            activities.close()
+
+    async def aggregate_activities(self, week_earlier, cur_tommorow):
+        return await self.run(self.es_client.aggregate_activities, week_earlier, cur_tommorow)
+
+    async def delete_old_info(self, max_days_store):
+        return await self.run(self.es_client.delete_old_info, max_days_store)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
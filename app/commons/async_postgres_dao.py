@@ -0,0 +1,116 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.commons import postgres_dao
+from app.utils.async_utils import run_in_executor
+
+logger = logging.getLogger("metricsGatherer.async_postgres_dao")
+
+
+class AsyncPostgresDAO:
+    """Asyncio interface to PostgresDAO.
+
+    psycopg2 calls are blocking, so every query runs in a worker thread on a connection of the shared
+    pool. The number of workers bounds how many queries run at the same time.
+    """
+
+    def __init__(self, app_settings, dao=None):
+        self.app_settings = app_settings
+        self.postgres_dao = dao if dao is not None else postgres_dao.PostgresDAO(app_settings)
+        self.concurrency = max(int(app_settings["postgresAsyncConcurrency"]), 1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # the workers are started on the first query, so the object can be used again after close
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="postgres_dao")
+            return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking call, which queries Postgres, in one of the workers"""
+        return await run_in_executor(self._get_executor(), func, *args, **kwargs)
+
+    async def test_query_handling(self):
+        return await self.run(self.postgres_dao.test_query_handling)
+
+    async def get_column_names_for_table(self, table_name):
+        return await self.run(self.postgres_dao.get_column_names_for_table, table_name)
+
+    async def get_auto_analysis_attribute_id(self):
+        return await self.run(self.postgres_dao.get_auto_analysis_attribute_id)
+
+    async def is_auto_analysis_enabled_for_project(self, project_id):
+        return await self.run(self.postgres_dao.is_auto_analysis_enabled_for_project, project_id)
+
+    async def get_auto_analysis_states(self):
+        return await self.run(self.postgres_dao.get_auto_analysis_states)
+
+    async def get_launch_id(self, item_id):
+        return await self.run(self.postgres_dao.get_launch_id, item_id)
+
+    async def get_launch_ids(self, item_ids):
+        return await self.run(self.postgres_dao.get_launch_ids, item_ids)
+
+    async def get_activities_by_project(self, project_id, start_date, end_date):
+        return await self.run(self.postgres_dao.get_activities_by_project, project_id, start_date, end_date)
+
+    async def _iter_in_batches(self, rows):
+        try:
+            while True:
+                batch = await self.run(list, itertools.islice(rows, self.postgres_dao.cursor_itersize))
+                for row in batch:
+                    yield row
+                if len(batch) < self.postgres_dao.cursor_itersize:
+                    break
+        finally:
+            rows.close()
+
+    async def iter_activities_by_project(self, project_id, start_date, end_date, after_id=None):
+        rows = self.postgres_dao.iter_activities_by_project(project_id, start_date, end_date, after_id=after_id)
+        async for row in self._iter_in_batches(rows):
+            yield row
+
+    async def iter_transitions_by_project(self, project_id, start_date, end_date, after_id=None):
+        transitions = self.postgres_dao.iter_transitions_by_project(
+            project_id, start_date, end_date, after_id=after_id)
+        async for transition in self._iter_in_batches(transitions):
+            yield transition
+
+    async def get_all_projects(self):
+        return await self.run(self.postgres_dao.get_all_projects)
+
+    async def get_all_unique_launch_ids(self, project_id, start_date, end_date):
+        return await self.run(self.postgres_dao.get_all_unique_launch_ids, project_id, start_date, end_date)
+
+    async def count_unique_launches(self, project_id, start_date, end_date):
+        return await self.run(self.postgres_dao.count_unique_launches, project_id, start_date, end_date)
+
+    async def get_issue_type_dict(self, project_id):
+        return await self.run(self.postgres_dao.get_issue_type_dict, project_id)
+
+    async def get_issue_type_dicts(self):
+        return await self.run(self.postgres_dao.get_issue_type_dicts)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
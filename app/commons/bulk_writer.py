@@ -0,0 +1,139 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import concurrent.futures
+import json
+import logging
+import threading
+
+logger = logging.getLogger("metricsGatherer.bulk_writer")
+
+REFRESH_TRUE = "true"
+REFRESH_FALSE = "false"
+REFRESH_WAIT_FOR = "wait_for"
+REFRESH_END_OF_RUN = "end_of_run"
+
+REQUEST_REFRESH = {
+    REFRESH_TRUE: True,
+    REFRESH_FALSE: False,
+    REFRESH_WAIT_FOR: REFRESH_WAIT_FOR,
+    REFRESH_END_OF_RUN: False
+}
+
+
+class BulkWriter:
+    """Collects documents into bulk batches, which are indexed by background threads"""
+
+    def __init__(self, es_client, app_config):
+        self.es_client = es_client
+        self.batch_size = max(int(app_config["esBulkBatchSize"]), 1)
+        self.batch_bytes = max(int(app_config["esBulkBatchBytes"]), 1)
+        self.workers = max(int(app_config["esBulkWorkers"]), 1)
+        self.refresh_policy = app_config["esBulkRefresh"]
+        if self.refresh_policy not in REQUEST_REFRESH:
+            logger.error("Unknown bulk refresh policy '%s', '%s' is used",
+                         self.refresh_policy, REFRESH_END_OF_RUN)
+            self.refresh_policy = REFRESH_END_OF_RUN
+        # producers wait when that many batches are already queued or being sent
+        self._slots = threading.BoundedSemaphore(max(int(app_config["esBulkQueueSize"]), 1))
+        self._lock = threading.Lock()
+        self._batches = {}
+        self._futures = set()
+        self._written_indices = set()
+        self._executor = None
+        self.stats = {"docs": 0, "batches": 0, "failed_docs": 0, "failed_batches": 0}
+        self._unreported_failed_docs = 0
+
+    def bulk_index(self, index_name, bulk_actions):
+        """Queue the documents, they are sent when a batch is full or on flush"""
+        for action in bulk_actions:
+            size = len(json.dumps(action.get("_source", {}), default=str))
+            with self._lock:
+                actions, batch_bytes = self._batches.get(index_name, ([], 0))
+                actions.append(action)
+                batch_bytes += size
+                self._batches[index_name] = (actions, batch_bytes)
+                is_full = len(actions) >= self.batch_size or batch_bytes >= self.batch_bytes
+                if is_full:
+                    del self._batches[index_name]
+            if is_full:
+                self._submit(index_name, actions)
+
+    def _submit(self, index_name, actions):
+        self._slots.acquire()
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bulk_writer")
+            self._written_indices.add(index_name)
+            future = self._executor.submit(self._send, index_name, actions)
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+
+    def _send(self, index_name, actions):
+        try:
+            failed_count = self.es_client.bulk_index(
+                index_name, actions, refresh=REQUEST_REFRESH[self.refresh_policy])
+        except Exception as err:
+            logger.error(err)
+            failed_count = len(actions)
+        finally:
+            self._slots.release()
+        if failed_count:
+            logger.error("Bulk request for index %s failed for %d of %d docs", index_name, failed_count, len(actions))
+        with self._lock:
+            self.stats["docs"] += len(actions) - failed_count
+            if failed_count:
+                self.stats["failed_docs"] += failed_count
+                self.stats["failed_batches"] += 1
+                self._unreported_failed_docs += failed_count
+            else:
+                self.stats["batches"] += 1
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def flush(self):
+        """Send the queued documents and wait until all bulk requests are finished.
+
+        Returns the number of documents which failed to be written since the previous flush.
+        """
+        with self._lock:
+            batches = list(self._batches.items())
+            self._batches = {}
+        for index_name, (actions, _) in batches:
+            self._submit(index_name, actions)
+        with self._lock:
+            futures = list(self._futures)
+        concurrent.futures.wait(futures)
+        with self._lock:
+            written_indices = list(self._written_indices)
+            self._written_indices.clear()
+        if self.refresh_policy == REFRESH_END_OF_RUN:
+            for index_name in written_indices:
+                self.es_client.refresh_index(index_name)
+        with self._lock:
+            failed_docs, self._unreported_failed_docs = self._unreported_failed_docs, 0
+        if failed_docs:
+            logger.error("%d docs weren't written by the bulk writer", failed_docs)
+        logger.debug("Bulk writer stats: %s", self.stats)
+        return failed_docs
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,100 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import operator
+from collections import namedtuple
+
+import numpy as np
+
+from app.commons.item_chains import ItemChains, Vocabulary
+
+ChainMetrics = namedtuple("ChainMetrics", [
+    "AA_analyzed", "changed_type", "manually_analyzed", "analyzed_items", "predicted_types", "real_types"])
+
+
+def is_to_investigate(issue_type):
+    return issue_type[:2].lower() == "ti"
+
+
+def calculate_chain_metrics(item_chain):
+    """Calculate the auto-analysis metrics of ItemChains or of {item: [(kind, new type[, old type]), ...]}"""
+    if isinstance(item_chain, ItemChains):
+        return calculate_encoded_chain_metrics(*item_chain.encode())
+    items = [item for item in item_chain if item_chain[item]]
+    if not items:
+        return ChainMetrics(0, 0, 0, [], [], [])
+    chains = [item_chain[item] for item in items]
+    lengths = np.fromiter(map(len, chains), dtype=np.int64, count=len(chains))
+    actions = list(itertools.chain.from_iterable(chains))
+    # "analyze" actions are (kind, new type), manual ones are (kind, new type, old type)
+    is_manual = np.fromiter(map(len, actions), dtype=np.int8, count=len(actions)) > 2
+    vocabulary = Vocabulary()
+    new_types = np.fromiter(map(vocabulary.__getitem__, map(operator.itemgetter(1), actions)),
+                            dtype=np.int64, count=len(actions))
+    old_types = np.full(len(actions), -1, dtype=np.int64)
+    manual_actions = list(itertools.compress(actions, is_manual))
+    old_types[is_manual] = np.fromiter(map(vocabulary.__getitem__, map(operator.itemgetter(2), manual_actions)),
+                                       dtype=np.int64, count=len(manual_actions))
+    issue_types = np.array(list(vocabulary), dtype=object)
+    return calculate_encoded_chain_metrics(items, lengths, is_manual, new_types, old_types, issue_types)
+
+
+def calculate_encoded_chain_metrics(items, lengths, is_manual, new_types, old_types, issue_types):
+    """Calculate the auto-analysis metrics of the item chains with vectorized operations over all actions.
+
+    The actions of all items are laid out one non-empty chain after another, the issue types are integer codes into
+    issue_types and the old type of "analyze" actions is -1.
+
+    For every item: it is analyzed when it has an "analyze" action; its type is changed when a manual
+    change, which is not from or to "To investigate", follows the first analysis; manual analyses
+    (changes from "To investigate") are counted up to that change. The predicted type is the one set by
+    the last analysis and the real type is set by the last manual change after it.
+    """
+    if not len(is_manual):
+        return ChainMetrics(0, 0, 0, [], [], [])
+    to_investigate = np.fromiter(map(is_to_investigate, issue_types), dtype=bool, count=len(issue_types))
+    # the lookup table gets one more entry for the missing old type of the "analyze" actions
+    to_investigate = np.append(to_investigate, False)
+
+    n_actions = len(is_manual)
+    positions = np.arange(n_actions)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    item_of_action = np.repeat(np.arange(len(items)), lengths)
+    is_analyze = ~is_manual
+    old_is_ti = is_manual & to_investigate[old_types]
+    new_is_ti = is_manual & to_investigate[new_types]
+
+    first_analyze = np.minimum.reduceat(np.where(is_analyze, positions, n_actions), starts)
+    last_analyze = np.maximum.reduceat(np.where(is_analyze, positions, -1), starts)
+    was_analyzed = first_analyze < n_actions
+
+    is_change = is_manual & ~old_is_ti & ~new_is_ti & (positions > first_analyze[item_of_action])
+    first_change = np.minimum.reduceat(np.where(is_change, positions, n_actions), starts)
+    manually_analyzed = np.count_nonzero(old_is_ti & (positions < first_change[item_of_action]))
+
+    is_correction = is_manual & (positions > last_analyze[item_of_action])
+    last_correction = np.maximum.reduceat(np.where(is_correction, positions, -1), starts)
+
+    analyzed = np.flatnonzero(was_analyzed)
+    predicted = new_types[last_analyze[analyzed]]
+    corrections = last_correction[analyzed]
+    real = np.where(corrections >= 0, new_types[np.maximum(corrections, 0)], predicted)
+    return ChainMetrics(
+        int(np.count_nonzero(was_analyzed)),
+        int(np.count_nonzero(first_change < n_actions)),
+        int(manually_analyzed),
+        [items[i] for i in analyzed],
+        issue_types[predicted].tolist(),
+        issue_types[real].tolist())
@@ -0,0 +1,162 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import datetime
+import logging
+
+logger = logging.getLogger("metricsGatherer.daily_partials")
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SUMMED_FIELDS = ["percent_not_found", "count", "avg_time_only_found_test_item_processed",
+                 "avg_time_test_item_processed", "errors_count"]
+LIST_FIELDS = ["model_info", "module_version", "errors"]
+
+
+def get_window_days(cur_date):
+    """Calendar days of the week before the gather date and the gather date itself"""
+    return [cur_date.date() - datetime.timedelta(days=days) for days in range(7, -1, -1)]
+
+
+def merge_partials(partials):
+    """Merge the day partials of a project into the activity stats of the whole period"""
+    methods = {}
+    launch_ids = set()
+    launch_added = 0
+    for partial in partials:
+        for method, method_stats in partial["methods"].items():
+            merged_stats = methods.get(method)
+            if merged_stats is None:
+                merged_stats = methods[method] = dict(
+                    [(field, 0) for field in SUMMED_FIELDS] + [(field, []) for field in LIST_FIELDS])
+            for field in SUMMED_FIELDS:
+                merged_stats[field] += method_stats[field]
+            for field in LIST_FIELDS:
+                merged_stats[field].extend(method_stats[field])
+        launch_ids.update(partial.get("launch_ids", []))
+        launch_added += partial.get("launch_added", 0)
+    for method_stats in methods.values():
+        for field in ["model_info", "module_version"]:
+            method_stats[field] = list(set(method_stats[field]))
+    return {"methods": methods, "launch_analyzed": len(launch_ids), "launch_added": launch_added}
+
+
+class DailyPartialsStore:
+    """Keeps the partial aggregates of all projects per day, which are merged into the stats of a week.
+
+    A day is saved once it is over, the days which are still going on are aggregated again by every run.
+    Every project has its own document per day, the document of the day itself lists the saved projects.
+    """
+
+    def __init__(self, es_client, postgres_dao, writer=None):
+        self.es_client = es_client
+        self.postgres_dao = postgres_dao
+        self.writer = writer or es_client
+        self._days = {}
+
+    def aggregate_day(self, day):
+        """Aggregate the analyzer activities and the launches of all projects for the day, None on errors"""
+        day_start = datetime.datetime.combine(day, datetime.time())
+        day_end = day_start + datetime.timedelta(days=1)
+        activity_stats = self.es_client.aggregate_activities(
+            day_start, day_end, include_end=False, with_launch_ids=True)
+        launches = self.postgres_dao.count_launches_by_day(day_start, day_end)
+        if activity_stats is None or launches is None:
+            return None
+        partials = {}
+        for project_id, project_stats in activity_stats.items():
+            partials[str(project_id)] = {
+                "methods": project_stats["methods"], "launch_ids": project_stats.get("launch_ids", [])}
+        for (project_id, _), launch_count in launches.items():
+            partials.setdefault(str(project_id), {"methods": {}, "launch_ids": []})["launch_added"] = launch_count
+        return partials
+
+    def save(self, day, partials):
+        gather_date = day.strftime(DATE_FORMAT)
+        gather_datetime = datetime.datetime.now().strftime(DATETIME_FORMAT)
+        actions = [{
+            "_id": "%s_%s" % (project_id, gather_date),
+            "_index": self.es_client.daily_partials_index,
+            "_source": {
+                "project_id": project_id,
+                "gather_date": gather_date,
+                "gather_datetime": gather_datetime,
+                "partial": partial
+            }
+        } for project_id, partial in partials.items()]
+        actions.append({
+            "_id": gather_date,
+            "_index": self.es_client.daily_partials_index,
+            "_source": {
+                "gather_date": gather_date,
+                "gather_datetime": gather_datetime,
+                "project_ids": sorted(partials)
+            }
+        })
+        self.writer.bulk_index(self.es_client.daily_partials_index, actions)
+
+    @staticmethod
+    def get_saved_partials(gather_date, saved_day, saved_partials):
+        """Collect the saved partials of the day, None if the day or any of its projects wasn't saved"""
+        if saved_day is None:
+            return None
+        if "projects" in saved_day:
+            # the partials of all projects were saved in the day document before
+            return saved_day["projects"]
+        partials = {}
+        for project_id in saved_day["project_ids"]:
+            saved_partial = saved_partials.get("%s_%s" % (project_id, gather_date))
+            if saved_partial is None:
+                return None
+            partials[project_id] = saved_partial["partial"]
+        return partials
+
+    def get_day_partials(self, days, now=None):
+        """Return the partials of all projects for the days, the days which weren't saved are aggregated"""
+        now = now or datetime.datetime.now()
+        days_to_read = [day for day in days if day not in self._days]
+        saved_days = self.es_client.get_documents(
+            self.es_client.daily_partials_index, [day.strftime(DATE_FORMAT) for day in days_to_read])
+        if saved_days is None:
+            saved_days = {}
+        saved_partials = self.es_client.get_documents(
+            self.es_client.daily_partials_index,
+            ["%s_%s" % (project_id, gather_date) for gather_date, saved_day in saved_days.items()
+             for project_id in saved_day.get("project_ids", [])])
+        if saved_partials is None:
+            saved_partials = {}
+        for day in days_to_read:
+            partials = self.get_saved_partials(
+                day.strftime(DATE_FORMAT), saved_days.get(day.strftime(DATE_FORMAT)), saved_partials)
+            if partials is not None:
+                self._days[day] = partials
+                continue
+            partials = self.aggregate_day(day)
+            if partials is None:
+                logger.error("Couldn't aggregate the partials of the day %s", day)
+                return None
+            if datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(days=1) <= now:
+                self.save(day, partials)
+            self._days[day] = partials
+        return {day: self._days[day] for day in days}
+
+    def get_window_stats(self, cur_date, now=None):
+        """Merge the day partials of the gather date week for every project, None if they can't be got"""
+        days_partials = self.get_day_partials(get_window_days(cur_date), now=now)
+        if days_partials is None:
+            return None
+        project_ids = set(project_id for partials in days_partials.values() for project_id in partials)
+        return {project_id: merge_partials(
+            partials[project_id] for partials in days_partials.values() if project_id in partials)
+            for project_id in project_ids}
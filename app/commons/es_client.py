@@ -12,9 +12,12 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import atexit
 import datetime
 import json
 import logging
+import threading
+import time
 import traceback
 
 import elasticsearch
@@ -27,6 +30,155 @@ from app.utils import utils, text_processing
 
 logger = logging.getLogger("metricsGatherer.es_client")
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+# per document values are rounded like python's round(x, 2) before summing, so that the sums
+# match the ones calculated from the raw documents
+ROUND_SCRIPT = "double round2(double value) {" \
+               " return new BigDecimal(value).setScale(2, RoundingMode.HALF_EVEN).doubleValue(); } "
+PERCENT_NOT_FOUND_SCRIPT = ROUND_SCRIPT + \
+    "def s = params._source;" \
+    " return round2(((Number) s.not_found).doubleValue() / ((Number) s.items_to_process).doubleValue()) * 100;"
+AVG_TIME_ONLY_FOUND_SCRIPT = ROUND_SCRIPT + \
+    "def s = params._source; long processed = ((Number) s.items_to_process).longValue()" \
+    " - ((Number) s.not_found).longValue(); if (processed == 0) { processed = 1; }" \
+    " return round2(((Number) s.processed_time).doubleValue() / processed);"
+AVG_TIME_ALL_SCRIPT = ROUND_SCRIPT + \
+    "def s = params._source;" \
+    " return round2(((Number) s.processed_time).doubleValue() / ((Number) s.items_to_process).doubleValue());"
+COLLECT_ERRORS_SCRIPTS = {
+    "init_script": "state.errors = []",
+    "map_script": "def errors = params._source.errors; if (errors instanceof List) { state.errors.addAll(errors) }"
+                  " else if (errors != null) { state.errors.add(errors) }",
+    "combine_script": "return state.errors",
+    "reduce_script": "def errors = []; for (s in states) { if (s != null) { errors.addAll(s) } } return errors"
+}
+
+
+class SharedEsClient:
+    """Elasticsearch client with its connection pool, shared by all EsClient objects of the same cluster"""
+
+    def __init__(self, es_client):
+        self.es_client = es_client
+        self.es_client_objects = 0
+
+    def get_http_pools(self):
+        """urllib3 pools behind the client, the requests based transport keeps them in its session adapters"""
+        http_pools = []
+        for connection in self.es_client.transport.connection_pool.connections:
+            http_pool = getattr(connection, "pool", None)
+            if http_pool is not None:
+                http_pools.append(http_pool)
+                continue
+            session = getattr(connection, "session", None)
+            if session is None:
+                continue
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                http_pools.extend(pools[key] for key in pools.keys())
+        return http_pools
+
+    def get_stats(self):
+        in_use_connections = 0
+        idle_connections = 0
+        opened_connections = 0
+        for http_pool in self.get_http_pools():
+            opened_connections += http_pool.num_connections
+            if http_pool.pool is None:
+                continue
+            queued = list(http_pool.pool.queue)
+            # the queue is filled with None placeholders, a checked out connection leaves an empty slot
+            in_use_connections += max(http_pool.pool.maxsize - len(queued), 0)
+            idle_connections += sum(1 for conn in queued if conn is not None and getattr(conn, "sock", None))
+        return {"es_client_objects": self.es_client_objects,
+                "open_connections": in_use_connections + idle_connections,
+                "in_use_connections": in_use_connections,
+                "idle_connections": idle_connections,
+                "opened_connections_total": opened_connections}
+
+
+def get_shared_es_client(es_host, app_config, create_client):
+    """Get the process-wide client for the cluster and credentials from the settings"""
+    key = (es_host, app_config["esUser"], app_config["esUseSsl"], app_config["esVerifyCerts"],
+           app_config["esCAcert"], app_config["esClientCert"], app_config["esClientKey"],
+           app_config["turnOffSslVerification"])
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = SharedEsClient(create_client())
+        _clients[key].es_client_objects += 1
+        return _clients[key].es_client
+
+
+def get_clients_stats():
+    with _clients_lock:
+        clients = list(_clients.items())
+    stats = []
+    for key, client in clients:
+        try:
+            stats.append(dict(client.get_stats(), host=text_processing.remove_credentials_from_url(key[0])))
+        except Exception as err:
+            logger.error("Couldn't get stats of the Elasticsearch client")
+            logger.error(err)
+    return stats
+
+
+@atexit.register
+def close_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.es_client.transport.close()
+        except Exception as err:
+            logger.error(err)
+
+
+class IndexMetadataCache:
+    """Remembers parsed mappings, existing indices and applied mappings for the client lifetime"""
+
+    def __init__(self):
+        self._mappings = {}
+        self._existing_indices = set()
+        self._applied_mappings = set()
+        self._creation_locks = {}
+        self._lock = threading.Lock()
+
+    def get_mappings(self, index_name):
+        with self._lock:
+            if index_name not in self._mappings:
+                self._mappings[index_name] = utils.read_json_file(
+                    "res", "%s_mappings.json" % index_name, to_json=True)
+            return self._mappings[index_name]
+
+    def creation_lock(self, index_name):
+        """Lock, which lets only one thread check and create the index"""
+        with self._lock:
+            return self._creation_locks.setdefault(index_name, threading.Lock())
+
+    def exists(self, index_name):
+        with self._lock:
+            return index_name in self._existing_indices
+
+    def mark_existing(self, index_name):
+        with self._lock:
+            self._existing_indices.add(index_name)
+
+    def mapping_applied(self, index_name):
+        with self._lock:
+            return index_name in self._applied_mappings
+
+    def mark_mapping_applied(self, index_name):
+        with self._lock:
+            self._existing_indices.add(index_name)
+            self._applied_mappings.add(index_name)
+
+    def invalidate(self, index_name):
+        with self._lock:
+            self._existing_indices.discard(index_name)
+            self._applied_mappings.discard(index_name)
+
 
 class EsClient:
 
@@ -41,9 +193,18 @@ class EsClient:
         self.rp_model_train_stats_index = "rp_model_train_stats"
         self.rp_suggest_metrics_index = "rp_suggestions_info_metrics"
         self.rp_model_remove_stats_index = "rp_model_remove_stats"
+        self.activity_state_index = "rp_activity_state"
+        self.daily_partials_index = "rp_stats_partials"
         self.tables_to_recreate = [self.rp_aa_stats_index, self.rp_model_train_stats_index,
                                    self.rp_suggest_metrics_index, self.rp_model_remove_stats_index]
-        self.es_client = self.create_es_client(self.esHost, app_config)
+        self.partitioned_indices = []
+        if app_config.get("esTimePartitionedIndices"):
+            self.partitioned_indices = [self.main_index, self.task_done_index, self.rp_model_remove_stats_index]
+        self.index_metadata = IndexMetadataCache()
+        # items rejected with 429 are resent with an exponential backoff
+        self.bulk_max_retries = int(app_config.get("esBulkMaxRetries", 0))
+        self.es_client = get_shared_es_client(
+            self.esHost, app_config, lambda: self.create_es_client(self.esHost, app_config))
 
     def create_es_client(self, es_host, app_config):
         if not app_config["esVerifyCerts"]:
@@ -58,6 +219,8 @@ class EsClient:
             "ca_certs": app_config["esCAcert"],
             "client_cert": app_config["esClientCert"],
             "client_key": app_config["esClientKey"],
+            # enough connections for the concurrent requests and the bulk writer threads
+            "maxsize": max(app_config["esAsyncConcurrency"] + app_config["esBulkWorkers"], 10),
         }
 
         if app_config["esUser"]:
@@ -92,12 +255,60 @@ class EsClient:
         except Exception as err:
             logger.error(err)
 
+    def is_partitioned(self, index_name):
+        return index_name in self.partitioned_indices
+
+    def get_read_index(self, index_name):
+        """Name to search in: the alias over all monthly partitions for partitioned indices"""
+        if self.is_partitioned(index_name):
+            return "%s-read" % index_name
+        return index_name
+
+    def get_partition_name(self, index_name, date):
+        return "%s-%s" % (index_name, date.strftime("%Y.%m"))
+
+    def get_search_indices(self, index_name, start_date, end_date):
+        """Indices which can contain documents of the dates, the legacy index included"""
+        if not self.is_partitioned(index_name):
+            return index_name
+        partitions = [index_name]
+        month = datetime.date(start_date.year, start_date.month, 1)
+        while month <= datetime.date(end_date.year, end_date.month, 1):
+            partitions.append(self.get_partition_name(index_name, month))
+            month = (month + datetime.timedelta(days=32)).replace(day=1)
+        return ",".join(partitions)
+
+    @staticmethod
+    def get_document_date(source):
+        gather_date = source.get("gather_date")
+        if isinstance(gather_date, datetime.date):
+            return gather_date
+        if isinstance(gather_date, str) and gather_date.strip():
+            return datetime.datetime.strptime(gather_date[:10], "%Y-%m-%d")
+        return datetime.datetime.now()
+
+    def create_partition(self, index_name, partition_name):
+        """Create the monthly partition behind the read alias, the legacy index is put behind it as well"""
+        read_alias = self.get_read_index(index_name)
+        response = self.create_index(
+            partition_name, self.index_metadata.get_mappings(index_name), aliases={read_alias: {}})
+        if len(response) and self.index_exists(index_name, print_error=False):
+            try:
+                self.es_client.indices.put_alias(index=index_name, name=read_alias)
+            except Exception as err:
+                logger.error("Couldn't add the index %s to the alias %s", index_name, read_alias)
+                logger.error(err)
+        return response
+
     def create_grafana_data_source(self, esHostGrafanaDatasource, index_name, time_field):
         index_exists = False
-        index_properties = utils.read_json_file(
-            "res", "%s_mappings.json" % index_name, to_json=True)
-        if not self.index_exists(index_name, print_error=False):
-            response = self.create_index(index_name, index_properties)
+        index_properties = self.index_metadata.get_mappings(index_name)
+        if not self.index_exists(self.get_read_index(index_name), print_error=False):
+            if self.is_partitioned(index_name):
+                response = self.create_partition(
+                    index_name, self.get_partition_name(index_name, datetime.datetime.now()))
+            else:
+                response = self.create_index(index_name, index_properties)
             if len(response):
                 index_exists = True
         else:
@@ -118,7 +329,7 @@ class EsClient:
                         "secureJsonData": {
                             "basicAuthPassword": es_pass
                         },
-                        "database": index_name,
+                        "database": self.get_read_index(index_name),
                         "jsonData": {
                             "esVersion": 70,
                             "maxConcurrentShardRequests": "1",
@@ -181,33 +392,90 @@ class EsClient:
             return False
 
     def index_exists(self, index_name, print_error=True):
+        if self.index_metadata.exists(str(index_name)):
+            return True
         try:
             index = self.es_client.indices.get(index=str(index_name))
+            if index is not None:
+                self.index_metadata.mark_existing(str(index_name))
             return index is not None
         except Exception as err:
             if print_error:
                 logger.error("Index %s was not found", str(index_name))
-                logger.error("ES Url %s", self.host)
+                logger.error("ES Url %s", text_processing.remove_credentials_from_url(self.esHost))
                 logger.error(err)
             return False
 
     def object_exists(self, index_name, row_id):
+        if self.is_partitioned(index_name):
+            return row_id in (self.get_existing_ids(index_name, [row_id]) or set())
         try:
             _ = self.es_client.get(index_name, id=row_id)
             return True
         except Exception as err:  # noqa
             return False
 
-    def create_index(self, index_name, index_properties):
+    def get_existing_ids(self, index_name, ids, batch_size=1000):
+        """Return the subset of ids which already have documents in the index, None if it can't be checked"""
+        ids = list(ids)
+        existing_ids = set()
+        read_index = self.get_read_index(index_name)
+        if not ids or not self.index_exists(read_index, print_error=False):
+            return existing_ids
+        try:
+            for i in range(0, len(ids), batch_size):
+                if self.is_partitioned(index_name):
+                    # mget can't be sent to an alias over several indices
+                    res = self.es_client.search(index=read_index, body={
+                        "size": batch_size, "_source": False,
+                        "query": {"ids": {"values": ids[i: i + batch_size]}}})
+                    existing_ids.update(hit["_id"] for hit in res["hits"]["hits"])
+                    continue
+                res = self.es_client.mget(
+                    body={"ids": ids[i: i + batch_size]}, index=index_name, _source=False)
+                existing_ids.update(doc["_id"] for doc in res["docs"] if doc.get("found"))
+        except Exception as err:
+            logger.error("Couldn't check existing documents in the index %s", index_name)
+            logger.error(err)
+            return None
+        return existing_ids
+
+    def get_documents(self, index_name, ids, batch_size=1000):
+        """Return the sources of the found documents by their ids, None if they can't be read"""
+        ids = list(ids)
+        documents = {}
+        if not ids or not self.index_exists(index_name, print_error=False):
+            return documents
+        try:
+            for i in range(0, len(ids), batch_size):
+                res = self.es_client.mget(body={"ids": ids[i: i + batch_size]}, index=index_name)
+                documents.update((doc["_id"], doc["_source"]) for doc in res["docs"] if doc.get("found"))
+        except Exception as err:
+            logger.error("Couldn't read documents from the index %s", index_name)
+            logger.error(err)
+            return None
+        return documents
+
+    def create_index(self, index_name, index_properties, aliases=None):
         logger.debug("Creating '%s' Elasticsearch index", str(index_name))
+        body = {
+            'settings': {"number_of_shards": 1},
+            'mappings': index_properties
+        }
+        if aliases:
+            body['aliases'] = aliases
         try:
-            response = self.es_client.indices.create(index=str(index_name), body={
-                'settings': {"number_of_shards": 1},
-                'mappings': index_properties
-            })
+            response = self.es_client.indices.create(index=str(index_name), body=body)
             logger.debug("Created '%s' Elasticsearch index", str(index_name))
+            self.index_metadata.mark_mapping_applied(str(index_name))
             return response
         except Exception as err:
+            if isinstance(err, elasticsearch.exceptions.RequestError) and \
+                    err.error == "resource_already_exists_exception":
+                # another process has just created it, its mapping is checked before the next bulk request
+                logger.debug("Elasticsearch index '%s' already exists", str(index_name))
+                self.index_metadata.mark_existing(str(index_name))
+                return {"acknowledged": True, "index": str(index_name)}
             logger.error("Couldn't create index")
             logger.error("ES Url %s", text_processing.remove_credentials_from_url(
                 self.esHost))
@@ -216,6 +484,7 @@ class EsClient:
 
     def delete_index(self, index_name):
         """Delete the whole index"""
+        self.index_metadata.invalidate(str(index_name))
         try:
             self.es_client.indices.delete(index=str(index_name))
             logger.info("ES Url %s", text_processing.remove_credentials_from_url(self.esHost))
@@ -227,81 +496,126 @@ class EsClient:
             logger.error(err)
             return False
 
-    def _recreate_index_if_needed(self, bodies, formatted_exception):
+    def _recreate_index_if_needed(self, bodies, formatted_exception, base_index_name=None):
         index_name = ""
         if bodies:
             index_name = bodies[0]["_index"]
         if not index_name.strip():
             return
-        index_properties = utils.read_json_file(
-            "res", "%s_mappings.json" % index_name, to_json=True)
+        base_index_name = base_index_name or index_name
+        self.index_metadata.invalidate(index_name)
+        index_properties = self.index_metadata.get_mappings(base_index_name)
         if "'type': 'mapper_parsing_exception'" in formatted_exception or \
                 "RequestError(400, 'illegal_argument_exception'" in formatted_exception:
-            if index_name in self.tables_to_recreate:
+            if base_index_name in self.tables_to_recreate:
                 self.delete_index(index_name)
-                self.create_index(index_name, index_properties)
+                if index_name != base_index_name:
+                    self.create_partition(base_index_name, index_name)
+                else:
+                    self.create_index(index_name, index_properties)
+
+    def refresh_index(self, index_name):
+        try:
+            self.es_client.indices.refresh(index=self.get_read_index(index_name))
+        except Exception as err:
+            logger.error("Couldn't refresh the index %s", index_name)
+            logger.error(err)
 
-    def bulk_index(self, index_name, bulk_actions):
+    def bulk_index(self, index_name, bulk_actions, refresh=True):
+        """Index the documents, the ones of partitioned indices go to the partition of their gather date.
+
+        Returns the number of documents which weren't indexed.
+        """
+        if not self.is_partitioned(index_name):
+            return self._bulk_index(index_name, bulk_actions, refresh=refresh)
+        partitions = {}
+        for action in bulk_actions:
+            partition_name = self.get_partition_name(index_name, self.get_document_date(action["_source"]))
+            partitions.setdefault(partition_name, []).append(dict(action, _index=partition_name))
+        failed_count = 0
+        for partition_name, partition_actions in partitions.items():
+            failed_count += self._bulk_index(
+                partition_name, partition_actions, base_index_name=index_name, refresh=refresh)
+        return failed_count
+
+    def _bulk_index(self, index_name, bulk_actions, base_index_name=None, refresh=True):
         exists_index = False
-        index_properties = utils.read_json_file(
-            "res", "%s_mappings.json" % index_name, to_json=True)
-        if not self.index_exists(index_name, print_error=False):
-            response = self.create_index(index_name, index_properties)
-            if len(response):
+        failed_count = len(bulk_actions)
+        index_properties = self.index_metadata.get_mappings(base_index_name or index_name)
+        # the bulk writer threads can write the first batches of a new index at the same time
+        with self.index_metadata.creation_lock(index_name):
+            if not self.index_exists(index_name, print_error=False):
+                if base_index_name is not None:
+                    response = self.create_partition(base_index_name, index_name)
+                else:
+                    response = self.create_index(index_name, index_properties)
+                if len(response):
+                    exists_index = True
+            else:
                 exists_index = True
-        else:
-            exists_index = True
         if exists_index:
             try:
                 try:
-                    self.es_client.indices.put_mapping(
-                        index=index_name,
-                        body=index_properties)
+                    if not self.index_metadata.mapping_applied(index_name):
+                        self.es_client.indices.put_mapping(
+                            index=index_name,
+                            body=index_properties)
+                        self.index_metadata.mark_mapping_applied(index_name)
                 except:  # noqa
                     formatted_exception = traceback.format_exc()
-                    self._recreate_index_if_needed(bulk_actions, formatted_exception)
+                    self._recreate_index_if_needed(bulk_actions, formatted_exception, base_index_name)
                 logger.debug('Indexing %d docs...' % len(bulk_actions))
                 try:
                     success_count, errors = elasticsearch.helpers.bulk(self.es_client,
                                                                        bulk_actions,
                                                                        chunk_size=1000,
                                                                        request_timeout=30,
-                                                                       refresh=True)
+                                                                       refresh=refresh,
+                                                                       max_retries=self.bulk_max_retries)
                 except:  # noqa
                     formatted_exception = traceback.format_exc()
-                    self._recreate_index_if_needed(bulk_actions, formatted_exception)
+                    self.index_metadata.invalidate(index_name)
+                    self._recreate_index_if_needed(bulk_actions, formatted_exception, base_index_name)
                     self.update_settings_after_read_only()
                     success_count, errors = elasticsearch.helpers.bulk(self.es_client,
                                                                        bulk_actions,
                                                                        chunk_size=1000,
                                                                        request_timeout=30,
-                                                                       refresh=True)
+                                                                       refresh=refresh,
+                                                                       max_retries=self.bulk_max_retries)
 
                 logger.debug("Processed %d logs", success_count)
+                failed_count = len(errors)
                 if errors:
                     logger.debug("Occured errors %s", errors)
             except Exception as err:
+                # helpers.bulk stops at the first failed chunk, so the whole request is counted as failed
                 logger.error(err)
                 logger.error("Bulking index for %s index finished with errors", index_name)
+        else:
+            logger.error("Couldn't index %d docs, the index %s doesn't exist", len(bulk_actions), index_name)
+        return failed_count
 
     def is_the_date_metrics_calculated(self, date):
-        if not self.index_exists(self.task_done_index, print_error=False):
+        if not self.index_exists(self.get_read_index(self.task_done_index), print_error=False):
             return False
-        res = self.es_client.search(self.task_done_index, body={
+        res = self.es_client.search(self.get_search_indices(self.task_done_index, date, date), body={
             "query": {
                 "bool": {
                     "filter": [
                         {"term": {"gather_date": date.date()}}
                     ]
                 }
-            }})
+            }}, ignore_unavailable=True)
         return len(res["hits"]["hits"]) > 0
 
-    def get_activities(self, project_id, week_earlier, cur_tommorow):
+    def get_activities(self, project_id, week_earlier, cur_tommorow, page_size=1000):
+        """Stream the analyzer activities of the project page by page with only the fields used in metrics"""
         if not self.index_exists(self.rp_aa_stats_index, print_error=False):
-            return []
-        res = self.es_client.search(self.rp_aa_stats_index, body={
-            "size": 10000,
+            return
+        yield from elasticsearch.helpers.scan(self.es_client, index=self.rp_aa_stats_index, query={
+            "_source": ["method", "items_to_process", "not_found", "launch_id", "processed_time",
+                        "model_info", "module_version", "errors", "errors_count"],
             "query": {
                 "bool": {
                     "filter": [
@@ -310,21 +624,96 @@ class EsClient:
                         {"term": {"project_id": project_id}}
                     ]
                 }
-            }})
-        return res["hits"]["hits"]
+            }}, size=page_size, scroll="5m")
+
+    def iter_composite_buckets(self, index_name, query, sources, aggs=None, page_size=1000):
+        """Page through all buckets of a composite aggregation"""
+        composite = {"size": page_size, "sources": sources}
+        after_key = None
+        while True:
+            if after_key is not None:
+                composite["after"] = after_key
+            body = {"size": 0, "query": query, "aggs": {"buckets": {"composite": composite}}}
+            if aggs:
+                body["aggs"]["buckets"]["aggs"] = aggs
+            res = self.es_client.search(index=index_name, body=body, ignore_unavailable=True)
+            buckets = res["aggregations"]["buckets"]["buckets"]
+            yield from buckets
+            after_key = res["aggregations"]["buckets"].get("after_key")
+            if not buckets or after_key is None:
+                break
+
+    def aggregate_activities(self, week_earlier, cur_tommorow, include_end=True, with_launch_ids=False):
+        """Sum the analyzer activities of all projects per method, None if the aggregation failed.
+
+        With with_launch_ids the ids of the auto-analyzed launches are returned as well, so that the stats
+        of several periods can be merged.
+        """
+        if not self.index_exists(self.rp_aa_stats_index, print_error=False):
+            return {}
+        date_filter = {"range": {"gather_datetime": {
+            "gte": week_earlier.strftime("%Y-%m-%d %H:%M:%S"),
+            "lte" if include_end else "lt": cur_tommorow.strftime("%Y-%m-%d %H:%M:%S")}}}
+        processed_filter = {"bool": {"must_not": [{"term": {"items_to_process": 0}}]}}
+        projects_stats = {}
+        try:
+            for bucket in self.iter_composite_buckets(
+                    self.rp_aa_stats_index, {"bool": {"filter": [date_filter]}},
+                    [{"project_id": {"terms": {"field": "project_id"}}},
+                     {"method": {"terms": {"field": "method"}}}],
+                    aggs={"processed": {"filter": processed_filter, "aggs": {
+                        "percent_not_found": {"sum": {"script": {"source": PERCENT_NOT_FOUND_SCRIPT}}},
+                        "avg_time_only_found": {"sum": {"script": {"source": AVG_TIME_ONLY_FOUND_SCRIPT}}},
+                        "avg_time_all": {"sum": {"script": {"source": AVG_TIME_ALL_SCRIPT}}},
+                        "errors_count": {"sum": {"field": "errors_count"}},
+                        "errors": {"scripted_metric": COLLECT_ERRORS_SCRIPTS},
+                        "model_info": {"terms": {"field": "model_info", "size": 10000}},
+                        "module_version": {"terms": {"field": "module_version", "size": 10000}}}}}):
+                processed = bucket["processed"]
+                project_stats = projects_stats.setdefault(
+                    bucket["key"]["project_id"], {"methods": {}, "launch_analyzed": 0})
+                project_stats["methods"][bucket["key"]["method"]] = {
+                    "percent_not_found": processed["percent_not_found"]["value"],
+                    "count": processed["doc_count"],
+                    "avg_time_only_found_test_item_processed": processed["avg_time_only_found"]["value"],
+                    "avg_time_test_item_processed": processed["avg_time_all"]["value"],
+                    "model_info": [term["key"] for term in processed["model_info"]["buckets"]],
+                    "module_version": [term["key"] for term in processed["module_version"]["buckets"]],
+                    "errors": processed["errors"]["value"] or [],
+                    "errors_count": int(processed["errors_count"]["value"])}
+            for bucket in self.iter_composite_buckets(
+                    self.rp_aa_stats_index,
+                    {"bool": {"filter": [date_filter, {"term": {"method": "auto_analysis"}}, processed_filter]}},
+                    [{"project_id": {"terms": {"field": "project_id"}}},
+                     {"launch_id": {"terms": {"field": "launch_id"}}}]):
+                project_stats = projects_stats[bucket["key"]["project_id"]]
+                project_stats["launch_analyzed"] += 1
+                if with_launch_ids:
+                    project_stats.setdefault("launch_ids", []).append(bucket["key"]["launch_id"])
+        except Exception as err:
+            logger.error("Couldn't aggregate analyzer activities")
+            logger.error(err)
+            return None
+        return projects_stats
 
-    def delete_old_info(self, max_days_store):
+    def delete_old_info(self, max_days_store, poll_interval=10):
+        """Start sliced delete by query tasks for the expired documents and follow them in the background"""
+        last_allowed_date = datetime.datetime.now() - datetime.timedelta(days=int(max_days_store))
+        for index in self.partitioned_indices:
+            self.delete_old_partitions(index, last_allowed_date)
+        last_allowed_date = last_allowed_date.strftime("%Y-%m-%d")
+        tasks = {}
         for index in [
             self.main_index, self.rp_aa_stats_index,
             self.task_done_index, self.rp_model_train_stats_index,
-            self.rp_suggest_metrics_index, self.rp_model_remove_stats_index
+            self.rp_suggest_metrics_index, self.rp_model_remove_stats_index,
+            self.daily_partials_index
         ]:
-            last_allowed_date = datetime.datetime.now() - datetime.timedelta(days=int(max_days_store))
-            last_allowed_date = last_allowed_date.strftime("%Y-%m-%d")
-            all_ids = set()
+            # only the legacy index is left to clean for the partitioned ones
+            if not self.index_exists(index, print_error=False):
+                continue
             try:
-                search_query = {
-                    "size": 1000,
+                res = self.es_client.delete_by_query(index=index, body={
                     "query": {
                         "bool": {
                             "filter": [
@@ -338,25 +727,56 @@ class EsClient:
                             ]
                         }
                     }
-                }
-                for res in elasticsearch.helpers.scan(self.es_client,
-                                                      query=search_query,
-                                                      index=index,
-                                                      scroll="5m"):
-                    all_ids.add(res["_id"])
-                bodies = []
-                for _id in all_ids:
-                    bodies.append({
-                        "_op_type": "delete",
-                        "_id": _id,
-                        "_index": index,
-                    })
-                success_count, errors = elasticsearch.helpers.bulk(self.es_client,
-                                                                   bodies,
-                                                                   chunk_size=1000,
-                                                                   request_timeout=30,
-                                                                   refresh=True)
+                }, slices="auto", conflicts="proceed", wait_for_completion=False, refresh=True)
+                tasks[index] = res["task"]
+                logger.debug("Started deleting old info for index %s, task %s", index, res["task"])
             except Exception as err:
                 logger.error("Couldn't delete old info in the index %s", index)
                 logger.error(err)
-            logger.debug("Finished deleting old info for index %s", index)
+        if tasks:
+            threading.Thread(target=self.wait_for_tasks, args=(tasks, poll_interval), daemon=True).start()
+        return tasks
+
+    def delete_old_partitions(self, index_name, last_allowed_date):
+        """Drop the monthly partitions which contain only documents older than the allowed date"""
+        try:
+            partitions = self.es_client.indices.get(index="%s-*" % index_name, ignore_unavailable=True)
+        except Exception as err:
+            logger.error("Couldn't get partitions of the index %s", index_name)
+            logger.error(err)
+            return
+        for partition_name in partitions:
+            try:
+                month_start = datetime.datetime.strptime(partition_name[len(index_name) + 1:], "%Y.%m")
+            except ValueError:
+                continue
+            next_month_start = (month_start + datetime.timedelta(days=32)).replace(day=1)
+            if next_month_start <= last_allowed_date:
+                self.delete_index(partition_name)
+
+    def wait_for_tasks(self, tasks, poll_interval=10):
+        """Poll the delete by query tasks and log their progress until all of them are completed"""
+        pending = dict(tasks)
+        while pending:
+            for index, task_id in list(pending.items()):
+                try:
+                    res = self.es_client.tasks.get(task_id=task_id)
+                except Exception as err:
+                    logger.error("Couldn't get the status of the task %s for index %s", task_id, index)
+                    logger.error(err)
+                    del pending[index]
+                    continue
+                status = res["task"]["status"]
+                if not res.get("completed"):
+                    logger.debug("Deleting old info for index %s: %d of %d docs deleted",
+                                 index, status.get("deleted", 0), status.get("total", 0))
+                    continue
+                del pending[index]
+                response = res.get("response", {})
+                if res.get("error") or response.get("failures"):
+                    logger.error("Deleting old info for index %s finished with errors: %s",
+                                 index, res.get("error") or response.get("failures"))
+                logger.debug("Finished deleting old info for index %s, deleted %d docs",
+                             index, response.get("deleted", status.get("deleted", 0)))
+            if pending:
+                time.sleep(poll_interval)
@@ -0,0 +1,97 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from array import array
+from enum import IntEnum
+
+import numpy as np
+
+
+class ActionKind(IntEnum):
+    ANALYZE = 0
+    MANUAL = 1
+
+
+ACTION_NAMES = {ActionKind.ANALYZE: "analyze", ActionKind.MANUAL: "manual"}
+
+NO_ISSUE_TYPE = -1
+
+
+class Vocabulary(dict):
+    """Gives every new issue type the next integer code"""
+
+    def __missing__(self, key):
+        self[key] = len(self)
+        return self[key]
+
+
+class ItemChains:
+    """Issue type actions of test items, stored as integer-coded columns.
+
+    Every action takes a few bytes: the item and issue types are codes, the issue type names are kept
+    once in the vocabulary.
+    """
+
+    __slots__ = ["items", "vocabulary", "_item_codes", "_kinds", "_new_types", "_old_types"]
+
+    def __init__(self):
+        self.items = {}
+        self.vocabulary = Vocabulary()
+        self._item_codes = array("i")
+        self._kinds = array("b")
+        self._new_types = array("i")
+        self._old_types = array("i")
+
+    def append(self, item, kind, new_type, old_type=None):
+        item_code = self.items.get(item)
+        if item_code is None:
+            item_code = self.items[item] = len(self.items)
+        self._item_codes.append(item_code)
+        self._kinds.append(kind)
+        self._new_types.append(self.vocabulary[new_type])
+        self._old_types.append(NO_ISSUE_TYPE if old_type is None else self.vocabulary[old_type])
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def encode(self):
+        """Return the items and the columns of their actions, laid out one item chain after another"""
+        item_codes = np.frombuffer(self._item_codes, dtype=np.int32)
+        # the stable sort keeps the order of the actions of every item
+        order = np.argsort(item_codes, kind="stable")
+        lengths = np.bincount(item_codes, minlength=len(self.items))
+        return (list(self.items), lengths,
+                np.frombuffer(self._kinds, dtype=np.int8)[order] == ActionKind.MANUAL,
+                np.frombuffer(self._new_types, dtype=np.int32)[order],
+                np.frombuffer(self._old_types, dtype=np.int32)[order],
+                np.array(list(self.vocabulary), dtype=object))
+
+    def to_dict(self):
+        """The chains as {item: [("analyze", new type) or ("manual", new type, old type), ...]}"""
+        issue_types = list(self.vocabulary)
+        chains = {item: [] for item in self.items}
+        items = list(self.items)
+        for item_code, kind, new_type, old_type in zip(
+                self._item_codes, self._kinds, self._new_types, self._old_types):
+            action = (ACTION_NAMES[kind], issue_types[new_type])
+            if kind == ActionKind.MANUAL:
+                action += (issue_types[old_type],)
+            chains[items[item_code]].append(action)
+        return chains
@@ -12,16 +12,26 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import asyncio
 import datetime
+import itertools
 import logging
 from time import time
 
-from sklearn.metrics import f1_score, accuracy_score
-
+from app.commons import activity_state
+from app.commons import activity_transitions
 from app.commons import es_client
 from app.commons import models_remover
 from app.commons import postgres_dao
+from app.commons.activity_window import ActivityWindow
+from app.commons.async_es_client import AsyncEsClient
+from app.commons.bulk_writer import BulkWriter
+from app.commons.chain_metrics import calculate_chain_metrics
+from app.commons.async_postgres_dao import AsyncPostgresDAO
+from app.commons.daily_partials import DailyPartialsStore
+from app.commons.item_chains import ActionKind, ItemChains
 from app.utils import text_processing
+from app.utils.classification_metrics import accuracy_score, f1_score
 
 logger = logging.getLogger("metricsGatherer.metrics_gatherer")
 
@@ -31,11 +41,16 @@ class MetricsGatherer:
     def __init__(self, app_settings):
         self.app_settings = app_settings
         self.postgres_dao = postgres_dao.PostgresDAO(app_settings)
+        self.async_postgres_dao = AsyncPostgresDAO(app_settings, dao=self.postgres_dao)
         self.es_client = es_client.EsClient(
             esHost=app_settings["esHost"],
             grafanaHost=app_settings["grafanaHost"],
             app_config=app_settings)
         self.models_remover = models_remover.ModelsRemover(app_settings)
+        self.async_es_client = AsyncEsClient(app_settings, client=self.es_client)
+        self.bulk_writer = BulkWriter(self.es_client, app_settings)
+        self.activity_state_store = activity_state.ActivityStateStore(self.es_client, writer=self.bulk_writer)
+        self.daily_partials = DailyPartialsStore(self.es_client, self.postgres_dao, writer=self.bulk_writer)
 
     def get_current_date_template(self, project_id, project_name, cur_date):
         return {"on": 0, "changed_type": 0, "AA_analyzed": 0,
@@ -62,74 +77,34 @@ class MetricsGatherer:
         return new_issue_value
 
     def derive_item_activity_chain(self, activities, issue_types_dict):
-        item_chain = {}
-        for record in activities:
-            if record["action"] == "analyzeItem":
-                if record["object_id"] not in item_chain:
-                    item_chain[record["object_id"]] = []
-                for r in record["details"]["history"]:
-                    if r["field"] == 'issueType':
-                        item_chain[record["object_id"]].append(
-                            ("analyze", self.replace_issue_type_with_code(r["newValue"], issue_types_dict)))
-            if record["action"] == "updateItem":
-                if record["object_id"] not in item_chain:
-                    item_chain[record["object_id"]] = []
-                for r in record["details"]["history"]:
-                    if r["field"] == 'issueType':
-                        item_chain[record["object_id"]].append(
-                            ("manual",
-                             self.replace_issue_type_with_code(r["newValue"], issue_types_dict),
-                             self.replace_issue_type_with_code(r["oldValue"], issue_types_dict)))
+        return self.derive_item_chain(activity_transitions.extract_transitions(activities), issue_types_dict)
+
+    def derive_item_chain(self, transitions, issue_types_dict):
+        item_chain = ItemChains()
+        for transition in transitions:
+            if transition.action == activity_transitions.ANALYZE_ITEM:
+                item_chain.append(
+                    transition.object_id, ActionKind.ANALYZE,
+                    self.replace_issue_type_with_code(transition.new_value, issue_types_dict))
+            if transition.action == activity_transitions.UPDATE_ITEM:
+                item_chain.append(
+                    transition.object_id, ActionKind.MANUAL,
+                    self.replace_issue_type_with_code(transition.new_value, issue_types_dict),
+                    self.replace_issue_type_with_code(transition.old_value, issue_types_dict))
         return item_chain
 
     def calculate_metrics(self, item_chain, cur_date_results):
-        cnt_changed = 0
-        cnt_all_analyzed = 0
-        analyzed_test_item_types = []
-        real_test_item_types = []
-        unique_launch_ids = set()
-        manually_analyzed_cnt = 0
-        for item in item_chain:
-            was_analyzed = False
-            analyzed_test_item_type = None
-            real_test_item_type = None
-            for idx in range(len(item_chain[item])):
-                action = item_chain[item][idx]
-                if action[0] == "manual" and action[2][:2].lower() == "ti":
-                    manually_analyzed_cnt += 1
-                if action[0] == "manual" and (action[1][:2].lower() == "ti" or action[2][:2].lower() == "ti"):
-                    continue
-                if action[0] == "analyze":
-                    was_analyzed = True
-                if was_analyzed and action[0] == "manual":
-                    cnt_changed += 1
-                    break
-            for idx in range(len(item_chain[item])):
-                action = item_chain[item][idx]
-                if action[0] == "analyze":
-                    analyzed_test_item_type = action[1]
-                    real_test_item_type = None
-                if was_analyzed and action[0] == "manual":
-                    real_test_item_type = action[1]
-            if was_analyzed:
-                cnt_all_analyzed += 1
-                launch_id = self.postgres_dao.get_launch_id(item)
-                if launch_id:
-                    unique_launch_ids.add(launch_id)
-            if analyzed_test_item_type is None:
-                continue
-            analyzed_test_item_types.append(analyzed_test_item_type)
-            if real_test_item_type is not None:
-                real_test_item_types.append(real_test_item_type)
-            else:
-                real_test_item_types.append(analyzed_test_item_type)
-        cur_date_results["AA_analyzed"] = cnt_all_analyzed
-        cur_date_results["changed_type"] = cnt_changed
+        metrics = calculate_chain_metrics(item_chain)
+        unique_launch_ids = set(
+            launch_id for launch_id in self.postgres_dao.get_launch_ids(metrics.analyzed_items).values()
+            if launch_id)
+        cur_date_results["AA_analyzed"] = metrics.AA_analyzed
+        cur_date_results["changed_type"] = metrics.changed_type
         cur_date_results["launch_analyzed"] = max(
             len(unique_launch_ids), cur_date_results["launch_analyzed"])
-        cur_date_results["manually_analyzed"] = manually_analyzed_cnt
+        cur_date_results["manually_analyzed"] = metrics.manually_analyzed
         cur_date_results = self.calculate_accuracy_f1_score(
-            real_test_item_types, analyzed_test_item_types, cur_date_results)
+            metrics.real_types, metrics.predicted_types, cur_date_results)
         return cur_date_results
 
     def calculate_accuracy_f1_score(
@@ -145,7 +120,12 @@ class MetricsGatherer:
                 average="macro"), 2) * 100
         return cur_date_results
 
-    def calculate_rp_stats_metrics(self, cur_date_results, project_id, cur_date):
+    def calculate_rp_stats_metrics(self, cur_date_results, project_id, cur_date, activity_stats=None):
+        if activity_stats is None:
+            activity_stats = self.collect_activity_stats(project_id, cur_date)
+        return self.apply_activity_stats(cur_date_results, activity_stats)
+
+    def collect_activity_stats(self, project_id, cur_date):
         week_earlier = cur_date - datetime.timedelta(days=7)
         cur_tommorow = cur_date + datetime.timedelta(days=1)
         all_activities = self.es_client.get_activities(project_id, week_earlier, cur_tommorow)
@@ -185,7 +165,10 @@ class MetricsGatherer:
                 method_activity["errors"].extend(res["_source"]["errors"])
             if "errors_count" in res["_source"]:
                 method_activity["errors_count"] += res["_source"]["errors_count"]
-        for action_res, action_val in activities_res.items():
+        return {"methods": activities_res, "launch_analyzed": len(unique_analyzed_launch_ids)}
+
+    def apply_activity_stats(self, cur_date_results, activity_stats):
+        for action_res, action_val in activity_stats["methods"].items():
             for column in ["model_info", "module_version", "errors", "errors_count"]:
                 default_obj = 0
                 if type(action_val[column]) == list:
@@ -214,38 +197,122 @@ class MetricsGatherer:
                 cur_date_results["avg_processing_time_test_item_cluster"] = all_avg_time
         for column in ["model_info", "module_version"]:
             cur_date_results[column] = list(set(cur_date_results[column]))
-        cur_date_results["launch_analyzed"] = len(unique_analyzed_launch_ids)
+        cur_date_results["launch_analyzed"] = activity_stats["launch_analyzed"]
         return cur_date_results
 
-    def gather_metrics_by_project(self, project_id, project_name, cur_date):
+    def get_projects_activity_stats(self, cur_date, activity_stats_by_date):
+        """Aggregate the analyzer activities of all projects once per gathered date"""
+        if cur_date in activity_stats_by_date:
+            return activity_stats_by_date[cur_date]
+        if self.app_settings["dailyPartialAggregates"]:
+            activity_stats_by_date[cur_date] = self.daily_partials.get_window_stats(cur_date)
+        else:
+            activity_stats_by_date[cur_date] = self.es_client.aggregate_activities(
+                cur_date - datetime.timedelta(days=7), cur_date + datetime.timedelta(days=1))
+        return activity_stats_by_date[cur_date]
+
+    async def _prefetch_projects_metadata(self):
+        all_projects, auto_analysis_states, issue_type_dicts = await asyncio.gather(
+            self.async_postgres_dao.get_all_projects(),
+            self.async_postgres_dao.get_auto_analysis_states(),
+            self.async_postgres_dao.get_issue_type_dicts())
+        return all_projects, auto_analysis_states, issue_type_dicts
+
+    def prefetch_projects_metadata(self):
+        """Load the projects with their auto-analysis states and issue types with concurrent queries.
+
+        The projects are None if they couldn't be read.
+        """
+        return asyncio.run(self._prefetch_projects_metadata())
+
+    async def _prefetch_es_metadata(self, all_projects, gather_dates):
+        row_ids = ["%s_%s" % (project_info["id"], cur_date.date().strftime("%Y-%m-%d"))
+                   for project_info in all_projects for cur_date in gather_dates]
+        # the day partials are merged later, when the stats of a date are needed
+        dates_to_aggregate = [] if self.app_settings["dailyPartialAggregates"] else gather_dates
+        gathered_row_ids, activity_stats, indices_exist = await asyncio.gather(
+            self.async_es_client.get_existing_ids(self.es_client.main_index, row_ids),
+            asyncio.gather(*[self.async_es_client.aggregate_activities(
+                cur_date - datetime.timedelta(days=7), cur_date + datetime.timedelta(days=1))
+                for cur_date in dates_to_aggregate]),
+            asyncio.gather(*[self.async_es_client.index_exists(text_processing.unite_project_name(
+                str(project_info["id"]), self.app_settings["esProjectIndexPrefix"]), print_error=False)
+                for project_info in all_projects]))
+        projects_with_index = set(
+            project_info["id"] for project_info, exists in zip(all_projects, indices_exist) if exists)
+        return gathered_row_ids, dict(zip(dates_to_aggregate, activity_stats)), projects_with_index
+
+    def prefetch_es_metadata(self, all_projects, gather_dates):
+        """Check the gathered rows and the project indices and aggregate analyzer stats with concurrent requests"""
+        return asyncio.run(self._prefetch_es_metadata(all_projects, gather_dates))
+
+    def read_project_transitions(self, project_id, start_date, end_date):
+        """Read the transitions of the project for the period.
+
+        In the incremental mode the transitions saved by the previous run are reused and only the activities
+        after its watermark are read from Postgres.
+        """
+        if not self.app_settings["incrementalActivityIngestion"]:
+            return self.postgres_dao.iter_transitions_by_project(project_id, start_date, end_date)
+        return self.iter_transitions_after_state(
+            project_id, start_date, end_date, self.activity_state_store.load(project_id))
+
+    def iter_transitions_after_state(self, project_id, start_date, end_date, state):
+        """Transitions of the period which continue the saved state, the activities are read only when iterated"""
+        # the next run gathers at least the next calendar day, so it starts not earlier than this
+        keep_from = datetime.datetime.combine(end_date.date(), datetime.time()) - datetime.timedelta(days=7)
+        if state is not None and keep_from < state.window_start:
+            # a backfill of older dates, the state saved by a later run is kept as it is
+            return self.postgres_dao.iter_transitions_by_project(project_id, start_date, end_date)
+        if state is None or state.window_start > start_date:
+            return activity_state.TransitionsRecorder(
+                self.postgres_dao.iter_transitions_by_project(project_id, start_date, end_date), keep_from)
+        saved_transitions = (
+            transition for transition in state.transitions if transition.creation_date >= start_date)
+        new_transitions = self.postgres_dao.iter_transitions_by_project(
+            project_id, start_date, end_date, after_id=state.last_activity_id)
+        return activity_state.TransitionsRecorder(
+            itertools.chain(saved_transitions, new_transitions), keep_from, state.last_activity_id)
+
+    def gather_metrics_by_project(self, project_id, project_name, cur_date, transitions=None,
+                                  is_aa_enabled=None, issue_types_dict=None, activity_stats=None,
+                                  launch_added=None):
         week_earlier = cur_date - datetime.timedelta(days=7)
         cur_tommorow = cur_date + datetime.timedelta(days=1)
-        is_aa_enabled = self.postgres_dao.is_auto_analysis_enabled_for_project(project_id)
+        if transitions is None:
+            transitions = self.read_project_transitions(project_id, week_earlier, cur_tommorow)
+        transitions = list(transitions)
+        # launches of the items were joined by the transitions query, so calculate_metrics needn't look them up
+        self.postgres_dao.cache_launch_ids(
+            (transition.object_id, transition.launch_id) for transition in transitions
+            if transition.launch_id is not None)
+        if is_aa_enabled is None:
+            is_aa_enabled = self.postgres_dao.is_auto_analysis_enabled_for_project(project_id)
+        if issue_types_dict is None:
+            issue_types_dict = self.postgres_dao.get_issue_type_dict(project_id)
         cur_date_results = self.get_current_date_template(project_id, project_name, cur_date)
         cur_date_results["on"] = int(is_aa_enabled)
-        cur_date_results = self.calculate_rp_stats_metrics(cur_date_results, project_id, cur_date)
-        activities = self.postgres_dao.get_activities_by_project(project_id, week_earlier, cur_tommorow)
-        issue_types_dict = self.postgres_dao.get_issue_type_dict(project_id)
-        item_chain = self.derive_item_activity_chain(activities, issue_types_dict)
+        cur_date_results = self.calculate_rp_stats_metrics(
+            cur_date_results, project_id, cur_date, activity_stats=activity_stats)
+        item_chain = self.derive_item_chain(transitions, issue_types_dict)
         cur_date_results = self.calculate_metrics(item_chain, cur_date_results)
-        all_launch_ids = self.postgres_dao.get_all_unique_launch_ids(
-            project_id, week_earlier, cur_tommorow)
-        cur_date_results["launch_added"] = len(all_launch_ids)
+        if launch_added is None:
+            launch_added = self.postgres_dao.count_unique_launches(project_id, week_earlier, cur_tommorow)
+        cur_date_results["launch_added"] = launch_added
         return cur_date_results
 
-    def find_sequence_of_aa_enability(self, project_id, cur_date, project_aa_states):
-        week_earlier = cur_date - datetime.timedelta(days=7)
-        cur_tommorow = cur_date + datetime.timedelta(days=1)
-        activities = self.postgres_dao.get_activities_by_project(project_id, week_earlier, cur_tommorow)
-        for record in activities:
-            if record["action"] == "updateAnalyzer":
-                for r in record["details"]["history"]:
-                    if r["field"] == 'analyzer.isAutoAnalyzerEnabled':
-                        creation_date = record["creation_date"].date()
-                        is_enabled = int(r["newValue"].lower() == "true")
-                        if creation_date not in project_aa_states:
-                            project_aa_states[creation_date] = (is_enabled, is_enabled)
-                        project_aa_states[creation_date] = (project_aa_states[creation_date][0], is_enabled)
+    def find_sequence_of_aa_enability(self, project_id, cur_date, project_aa_states, transitions=None):
+        if transitions is None:
+            week_earlier = cur_date - datetime.timedelta(days=7)
+            cur_tommorow = cur_date + datetime.timedelta(days=1)
+            transitions = self.postgres_dao.iter_transitions_by_project(project_id, week_earlier, cur_tommorow)
+        for transition in transitions:
+            if transition.action == activity_transitions.UPDATE_ANALYZER:
+                creation_date = transition.creation_date.date()
+                is_enabled = int(transition.new_value.lower() == "true")
+                if creation_date not in project_aa_states:
+                    project_aa_states[creation_date] = (is_enabled, is_enabled)
+                project_aa_states[creation_date] = (project_aa_states[creation_date][0], is_enabled)
         return project_aa_states
 
     def fill_right_aa_enable_states(self, gathered_rows, project_aa_states):
@@ -264,41 +331,141 @@ class MetricsGatherer:
                     cur_state_ind += 1
         return gathered_rows
 
-    def gather_metrics(self, period_start, period_end):
-        all_projects = self.postgres_dao.get_all_projects()
-        start_time = time()
-        for project_info in all_projects:
-            start_project_time = time()
+    def gather_project_metrics(self, project_info, transitions, dates_to_gather, activity_stats_by_date,
+                               is_aa_enabled=None, issue_types_dict=None):
+        """Gather the rows of the project for the dates and queue them for writing, returns whether it succeeded.
+
+        The transitions cover all dates at once, each day takes its 8-day slice of them.
+        """
+        start_project_time = time()
+        activity_window = None
+        try:
+            project_id = project_info["id"]
+            project_name = project_info["name"]
+            gathered_rows = []
+            project_aa_states = {}
+            activity_window = ActivityWindow(transitions)
+            for cur_date in dates_to_gather:
+                activity_stats = None
+                launch_added = None
+                projects_activity_stats = self.get_projects_activity_stats(cur_date, activity_stats_by_date)
+                if projects_activity_stats is not None:
+                    activity_stats = projects_activity_stats.get(
+                        str(project_id), {"methods": {}, "launch_analyzed": 0})
+                    if self.app_settings["dailyPartialAggregates"]:
+                        launch_added = activity_stats.get("launch_added", 0)
+                day_transitions = activity_window.slide(
+                    cur_date - datetime.timedelta(days=7), cur_date + datetime.timedelta(days=1))
+                project_aa_states = self.find_sequence_of_aa_enability(
+                    project_id, cur_date, project_aa_states, transitions=day_transitions)
+                gathered_row = self.gather_metrics_by_project(
+                    project_id, project_name, cur_date, transitions=day_transitions,
+                    is_aa_enabled=is_aa_enabled, issue_types_dict=issue_types_dict,
+                    activity_stats=activity_stats, launch_added=launch_added)
+                gathered_rows.append(gathered_row)
+            gathered_rows = self.fill_right_aa_enable_states(gathered_rows, project_aa_states)
+            bulk_actions = [{
+                '_id': "%s_%s" % (row["project_id"], row["gather_date"]),
+                '_index': self.es_client.main_index,
+                '_source': row,
+            } for row in gathered_rows]
+            self.bulk_writer.bulk_index(self.es_client.main_index, bulk_actions)
+            if isinstance(transitions, activity_state.TransitionsRecorder) and transitions.completed:
+                self.activity_state_store.save(project_id, transitions.get_state())
+            return len(gathered_rows) > 0
+        except Exception as err:
+            logger.error("Error occured for project %s", project_info)
+            logger.error(err)
+            return False
+        finally:
+            if activity_window is not None:
+                activity_window.close()
+            logger.debug("Project info %s gathering took %.2f s.",
+                         project_info["id"], time() - start_project_time)
+
+    async def _gather_projects(self, all_projects, period_start, period_end, gather_dates, gathered_row_ids,
+                               activity_stats_by_date, projects_with_index, auto_analysis_states,
+                               issue_type_dicts):
+        start_date = period_start - datetime.timedelta(days=7)
+        end_date = period_end + datetime.timedelta(days=1)
+
+        async def read_project(project_id):
+            """Find the dates to gather and prepare the transitions of the project, they are read lazily"""
+            row_ids = ["%s_%s" % (project_id, cur_date.date().strftime("%Y-%m-%d")) for cur_date in gather_dates]
+            if gathered_row_ids is None:
+                # the batch check failed, so every row is looked up, the requests of all projects are multiplexed
+                rows_gathered = await asyncio.gather(*[
+                    self.async_es_client.object_exists(self.es_client.main_index, row_id) for row_id in row_ids])
+            else:
+                rows_gathered = [row_id in gathered_row_ids for row_id in row_ids]
+            dates_to_gather = [
+                cur_date for cur_date, is_gathered in zip(gather_dates, rows_gathered) if not is_gathered]
+            if not dates_to_gather:
+                return dates_to_gather, None
+            if self.app_settings["incrementalActivityIngestion"]:
+                state = await self.async_es_client.run(self.activity_state_store.load, project_id)
+                return dates_to_gather, self.iter_transitions_after_state(project_id, start_date, end_date, state)
+            return dates_to_gather, self.postgres_dao.iter_transitions_by_project(project_id, start_date, end_date)
+
+        async def gather_project(project_info):
+            project_id = project_info["id"]
+            if project_id not in projects_with_index:
+                return False
             try:
-                project_id = project_info["id"]
-                project_name = project_info["name"]
-                project_with_prefix = text_processing.unite_project_name(
-                    str(project_id), self.app_settings["esProjectIndexPrefix"])
-                if not self.es_client.index_exists(project_with_prefix, print_error=False):
-                    continue
-                gathered_rows = []
-                project_aa_states = {}
-                for st_date_day in range((period_end - period_start).days + 1):
-                    cur_date = period_start + datetime.timedelta(days=st_date_day)
-                    cur_date_row_id = "%s_%s" % (project_id, cur_date.date().strftime("%Y-%m-%d"))
-                    if self.es_client.object_exists(self.es_client.main_index, cur_date_row_id):
-                        continue
-                    project_aa_states = self.find_sequence_of_aa_enability(
-                        project_id, cur_date, project_aa_states)
-                    gathered_row = self.gather_metrics_by_project(project_id, project_name, cur_date)
-                    gathered_rows.append(gathered_row)
-                gathered_rows = self.fill_right_aa_enable_states(gathered_rows, project_aa_states)
-                bulk_actions = [{
-                    '_id': "%s_%s" % (row["project_id"], row["gather_date"]),
-                    '_index': self.es_client.main_index,
-                    '_source': row,
-                } for row in gathered_rows]
-                self.es_client.bulk_index(self.es_client.main_index, bulk_actions)
-                if gathered_rows:
-                    self.models_remover.apply_remove_model_policies(project_id)
+                dates_to_gather, transitions = await read_project(project_id)
             except Exception as err:
                 logger.error("Error occured for project %s", project_info)
                 logger.error(err)
-            logger.debug("Project info %s gathering took %.2f s.",
-                         project_info["id"], time() - start_project_time)
+                return False
+            if not dates_to_gather:
+                return False
+            is_aa_enabled = None
+            if auto_analysis_states is not None:
+                is_aa_enabled = auto_analysis_states.get(project_id, False)
+            issue_types_dict = None
+            if issue_type_dicts is not None:
+                issue_types_dict = issue_type_dicts.get(project_id, {})
+            # each project streams its transitions on its own connection, the workers bound how many run at once
+            return await self.async_postgres_dao.run(
+                self.gather_project_metrics, project_info, transitions, dates_to_gather, activity_stats_by_date,
+                is_aa_enabled=is_aa_enabled, issue_types_dict=issue_types_dict)
+
+        gathered = await asyncio.gather(*[gather_project(project_info) for project_info in all_projects])
+        return [project_info["id"] for project_info, is_gathered in zip(all_projects, gathered) if is_gathered]
+
+    def gather_metrics(self, period_start, period_end):
+        """Gather the metrics of all projects for the period, returns whether all of them were written"""
+        try:
+            return self._gather_metrics(period_start, period_end)
+        finally:
+            self.async_postgres_dao.close()
+            self.bulk_writer.close()
+            self.async_es_client.close()
+
+    def _gather_metrics(self, period_start, period_end):
+        start_time = time()
+        all_projects, auto_analysis_states, issue_type_dicts = self.prefetch_projects_metadata()
+        if all_projects is None:
+            logger.error("Couldn't read the projects, the metrics aren't gathered")
+            return False
+        logger.debug("Prefetched metadata of %d projects for %.2f s.", len(all_projects), time() - start_time)
+        gather_dates = [(period_start + datetime.timedelta(days=st_date_day))
+                        for st_date_day in range((period_end - period_start).days + 1)]
+        gathered_row_ids, activity_stats_by_date, projects_with_index = self.prefetch_es_metadata(
+            all_projects, gather_dates)
+        if projects_with_index:
+            # the projects are gathered in parallel, so they only read the stats of the dates
+            for cur_date in gather_dates:
+                self.get_projects_activity_stats(cur_date, activity_stats_by_date)
+        logger.debug("Prefetched Elasticsearch metadata for %.2f s.", time() - start_time)
+        gathered_projects = asyncio.run(self._gather_projects(
+            all_projects, period_start, period_end, gather_dates, gathered_row_ids, activity_stats_by_date,
+            projects_with_index, auto_analysis_states, issue_type_dicts))
+        # the policies read the gathered rows, so they are applied once all of them are written
+        failed_docs = self.bulk_writer.flush()
+        policies_metrics = self.models_remover.get_policies_metrics() if gathered_projects else {}
+        for project_id in gathered_projects:
+            self.models_remover.apply_remove_model_policies(project_id, policies_metrics=policies_metrics)
         logger.info("Finished gathering metrics for all projects for %.2f s.", time() - start_time)
+        logger.debug("Postgres connection pool stats: %s", self.postgres_dao.pool.get_stats())
+        return failed_docs == 0
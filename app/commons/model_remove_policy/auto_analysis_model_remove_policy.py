@@ -23,11 +23,19 @@ class AutoAnalysisModelRemovePolicy(ModelRemovePolicy):
         ModelRemovePolicy.__init__(
             self, app_config, conditions_field=conditions_field, model_name=model_name)
 
+    def get_metrics_index(self, week_earlier, cur_tommorow):
+        if not self.es_client.index_exists(
+                self.es_client.get_read_index(self.es_client.main_index), print_error=False):
+            return ""
+        return self.es_client.get_search_indices(self.es_client.main_index, week_earlier, cur_tommorow)
+
     def get_gathered_metrics(self, week_earlier, cur_tommorow, project_id):
-        if not self.es_client.index_exists(self.es_client.main_index, print_error=False):
+        if not self.es_client.index_exists(
+                self.es_client.get_read_index(self.es_client.main_index), print_error=False):
             return []
         else:
-            res = self.es_client.es_client.search(self.es_client.main_index, body={
+            res = self.es_client.es_client.search(self.es_client.get_search_indices(
+                self.es_client.main_index, week_earlier, cur_tommorow), body={
                 "size": 1000,
                 "query": {
                     "bool": {
@@ -38,5 +46,5 @@ class AutoAnalysisModelRemovePolicy(ModelRemovePolicy):
                             {"term": {"project_id": project_id}}
                         ]
                     }
-                }})
+                }}, ignore_unavailable=True)
             return res
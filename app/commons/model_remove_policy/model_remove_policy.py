@@ -12,14 +12,32 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import logging
+
 import numpy as np
 
 from app.commons import es_client
 from app.utils import utils
 
+logger = logging.getLogger("metricsGatherer.model_remove_policy")
+
+# the means are calculated from the stored values, the doc values of the integer mapped fields
+# are truncated floats, e.g. f1-score 56.99999999999999 would be averaged as 56
+SOURCE_MEAN_SCRIPTS = {
+    "init_script": "state.sum = 0.0; state.count = 0",
+    "map_script": "def value = params._source[params.field];"
+                  " if (value instanceof Number) { state.sum += value.doubleValue(); state.count++ }",
+    "combine_script": "return state",
+    "reduce_script": "double sum = 0; long count = 0; for (s in states) { if (s != null) {"
+                     " sum += s.sum; count += s.count } } return count == 0 ? null : sum / count"
+}
+
 
 class ModelRemovePolicy:
 
+    project_field = "project_id"
+    date_field = "gather_datetime"
+
     def __init__(self, app_config, conditions_field="", model_name=""):
         self.app_config = app_config
         self.model_name = model_name
@@ -34,6 +52,50 @@ class ModelRemovePolicy:
         """Should be implemented in subclasses"""
         return []
 
+    def get_metrics_index(self, week_earlier, cur_tommorow):
+        """Should be implemented in subclasses"""
+        return ""
+
+    def get_projects_metrics(self, week_earlier, cur_tommorow):
+        """Average the condition fields of all projects with one composite aggregation, None if it failed"""
+        index_name = self.get_metrics_index(week_earlier, cur_tommorow)
+        if not index_name:
+            return {}
+        aggs = {"module_version": {"terms": {"field": "module_version", "size": 1000}}}
+        for i, (field, _, _) in enumerate(self.conditions):
+            aggs["condition_%d" % i] = {"scripted_metric": dict(SOURCE_MEAN_SCRIPTS, params={"field": field})}
+        projects_metrics = {}
+        try:
+            for bucket in self.es_client.iter_composite_buckets(index_name, {"bool": {"filter": [
+                    {"range": {self.date_field: {
+                        "gte": week_earlier.strftime("%Y-%m-%d %H:%M:%S"),
+                        "lte": cur_tommorow.strftime("%Y-%m-%d %H:%M:%S")}}}]}},
+                    [{"project": {"terms": {"field": self.project_field}}}], aggs=aggs):
+                projects_metrics[bucket["key"]["project"]] = {
+                    "means": [bucket["condition_%d" % i]["value"] for i in range(len(self.conditions))],
+                    "module_version": [term["key"] for term in bucket["module_version"]["buckets"]]}
+        except Exception as err:
+            logger.error("Couldn't aggregate metrics of the %s model remove policy", self.model_name)
+            logger.error(err)
+            return None
+        return projects_metrics
+
+    def check_project_metrics(self, project_metrics):
+        """Same as check_metrics for the means aggregated by get_projects_metrics"""
+        cur_metrics = []
+        should_be_deleted = False
+        module_version = []
+        if project_metrics is None:
+            return should_be_deleted, cur_metrics, module_version
+        for (field, operator, score), mean in zip(self.conditions, project_metrics["means"]):
+            module_version = project_metrics["module_version"]
+            if mean is not None:
+                metrics_mean = np.round(mean, 2)
+                cur_metrics.append((field, metrics_mean))
+                if utils.compare_metrics(metrics_mean, score, operator):
+                    should_be_deleted = True
+        return should_be_deleted, cur_metrics, list(module_version)
+
     def get_conditions(self):
         if self.conditions_field in self.app_config:
             return self.app_config[self.conditions_field]
@@ -17,12 +17,20 @@ from app.commons.model_remove_policy.model_remove_policy import ModelRemovePolic
 
 class SuggestModelRemovePolicy(ModelRemovePolicy):
 
+    project_field = "project"
+    date_field = "savedDate"
+
     def __init__(self, app_config,
                  conditions_field="suggestModelRemovePolicy",
                  model_name="suggestion"):
         ModelRemovePolicy.__init__(
             self, app_config, conditions_field=conditions_field, model_name=model_name)
 
+    def get_metrics_index(self, week_earlier, cur_tommorow):
+        if not self.es_client.index_exists(self.es_client.rp_suggest_metrics_index, print_error=False):
+            return ""
+        return self.es_client.rp_suggest_metrics_index
+
     def get_gathered_metrics(self, week_earlier, cur_tommorow, project_id):
         if not self.es_client.index_exists(
                 self.es_client.rp_suggest_metrics_index, print_error=False):
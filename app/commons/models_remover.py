@@ -40,7 +40,17 @@ class ModelsRemover:
             grafanaHost=app_config["grafanaHost"],
             app_config=app_config)
 
-    def apply_remove_model_policies(self, project_id):
+    def get_policies_metrics(self):
+        """Aggregate the metrics of all projects for every policy, which are then checked per project"""
+        if not self.app_config["amqpUrl"].strip():
+            return {}
+        cur_date = utils.take_the_date_to_check()
+        week_earlier = cur_date - datetime.timedelta(days=7)
+        cur_tommorow = cur_date + datetime.timedelta(days=1)
+        return {model_type: policy.get_projects_metrics(week_earlier, cur_tommorow)
+                for model_type, policy in self.model_policies.items()}
+
+    def apply_remove_model_policies(self, project_id, policies_metrics=None):
         _amqp_client = None
         try:
             if not self.app_config["amqpUrl"].strip():
@@ -58,7 +68,7 @@ class ModelsRemover:
                 if not model_folder.strip():
                     continue
                 should_be_deleted, cur_metrics, module_version = self.should_model_be_deleted(
-                    model_type, project_id)
+                    model_type, project_id, policies_metrics=policies_metrics)
                 is_deleted = 0
                 if should_be_deleted:
                     is_deleted = _amqp_client.call(json.dumps(
@@ -91,7 +101,10 @@ class ModelsRemover:
         if _amqp_client is not None:
             _amqp_client.close_connections()
 
-    def should_model_be_deleted(self, model_type, project_id):
+    def should_model_be_deleted(self, model_type, project_id, policies_metrics=None):
+        if policies_metrics and policies_metrics.get(model_type) is not None:
+            return self.model_policies[model_type].check_project_metrics(
+                policies_metrics[model_type].get(str(project_id)))
         cur_date = utils.take_the_date_to_check()
         week_earlier = cur_date - datetime.timedelta(days=7)
         cur_tommorow = cur_date + datetime.timedelta(days=1)
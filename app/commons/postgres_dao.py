@@ -14,133 +14,530 @@
 
 import logging
 import re
+import threading
+import uuid
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from time import time
 
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+from app.commons.activity_transitions import Transition
+from app.commons.row_factory import NAMED_TUPLE, SLOTS, create_row_factory
+from app.utils.lru_cache import LRUCache
 
 logger = logging.getLogger("metricsGatherer.postgres_dao")
 
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledConnection(psycopg2.extensions.connection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time()
+        self.last_used_at = self.created_at
+        self.prepared_statements = set()
+
+
+class PostgresConnectionPool:
+    """Thread-safe pool of long-lived connections to the ReportPortal database"""
+
+    def __init__(self, app_settings):
+        self.connection_params = {
+            "user": app_settings["postgresUser"],
+            "password": app_settings["postgresPassword"],
+            "host": app_settings["postgresHost"],
+            "port": app_settings["postgresPort"],
+            "database": app_settings["postgresDatabase"]}
+        self.min_size = max(int(app_settings["postgresPoolMinSize"]), 0)
+        self.max_size = max(int(app_settings["postgresPoolMaxSize"]), self.min_size, 1)
+        self.timeout = float(app_settings["postgresPoolTimeout"])
+        self.validation_interval = float(app_settings["postgresPoolValidationInterval"])
+        self.idle_timeout = float(app_settings["postgresPoolIdleTimeout"])
+        self._idle = deque()
+        self._in_use = set()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "validation_failures": 0,
+            "reconnects": 0}
+
+    def _connect(self):
+        connection = psycopg2.connect(connection_factory=PooledConnection, **self.connection_params)
+        with self._condition:
+            self._stats["connections_created"] += 1
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception as err:  # noqa
+            pass
+        with self._condition:
+            self._stats["connections_closed"] += 1
+
+    def _is_valid(self, connection):
+        if connection.closed:
+            return False
+        if connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time() - connection.last_used_at < self.validation_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("select 1")
+            connection.rollback()
+            return True
+        except Exception as err:
+            logger.debug("Pooled Postgres connection failed validation: %s", err)
+            return False
+
+    def getconn(self):
+        start_time = time()
+        waited = False
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = self.timeout - (time() - start_time)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise psycopg2.pool.PoolError(
+                        "Couldn't get a Postgres connection from the pool in %.2f s." % self.timeout)
+                waited = True
+                self._condition.wait(remaining)
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time"] += time() - start_time
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                self._size += 1
+        try:
+            if connection is not None and not self._is_valid(connection):
+                with self._condition:
+                    self._stats["validation_failures"] += 1
+                self._close(connection)
+                connection = None
+            if connection is None:
+                connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._in_use.add(connection)
+        return connection
+
+    def putconn(self, connection, discard=False):
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Exception as err:
+                logger.debug("Couldn't reset a Postgres connection: %s", err)
+                discard = True
+        connection.last_used_at = time()
+        with self._condition:
+            self._in_use.discard(connection)
+            # up to max_size connections are kept, so concurrent queries don't reconnect every time
+            keep = not discard and not connection.closed
+            if keep:
+                self._idle.append(connection)
+            else:
+                self._size -= 1
+            self._condition.notify()
+        if not keep:
+            self._close(connection)
+        self._close_expired()
+
+    def _close_expired(self):
+        """Close the connections idle for longer than idle_timeout, keeping at least min_size of them"""
+        expired = []
+        now = time()
+        with self._condition:
+            # the idle connections are ordered by their last use, the oldest are on the left
+            while len(self._idle) > self.min_size and now - self._idle[0].last_used_at > self.idle_timeout:
+                expired.append(self._idle.popleft())
+                self._size -= 1
+            if expired:
+                self._condition.notify(len(expired))
+        for connection in expired:
+            self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.getconn()
+        discard = False
+        try:
+            yield connection
+        except CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.putconn(connection, discard=discard)
+
+    def execute(self, callback, retries=1):
+        """Run callback(connection) on a pooled connection, reconnecting if the connection is broken"""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as connection:
+                    return callback(connection)
+            except CONNECTION_ERRORS as err:
+                if attempt >= retries:
+                    raise
+                logger.debug("Postgres connection was lost, reconnecting: %s", err)
+                with self._condition:
+                    self._stats["reconnects"] += 1
+
+    def close_all(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for connection in idle:
+            self._close(connection)
+
+    def get_stats(self):
+        now = time()
+        with self._condition:
+            stats = dict(self._stats)
+            connections = list(self._idle) + list(self._in_use)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = len(self._in_use)
+        ages = [now - conn.created_at for conn in connections]
+        stats["min_size"] = self.min_size
+        stats["max_size"] = self.max_size
+        stats["avg_wait_time"] = round(stats["wait_time"] / stats["waits"], 4) if stats["waits"] else 0.0
+        stats["wait_time"] = round(stats["wait_time"], 4)
+        stats["max_connection_age"] = round(max(ages), 2) if ages else 0.0
+        stats["avg_connection_age"] = round(sum(ages) / len(ages), 2) if ages else 0.0
+        return stats
+
+
+def get_connection_pool(app_settings):
+    """Get the process-wide connection pool for the database described in the settings"""
+    key = (app_settings["postgresUser"], app_settings["postgresHost"],
+           str(app_settings["postgresPort"]), app_settings["postgresDatabase"])
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = PostgresConnectionPool(app_settings)
+        return _pools[key]
+
+
+def get_pools_stats():
+    with _pools_lock:
+        pools = list(_pools.items())
+    return [dict(pool.get_stats(), host=key[1], database=key[3]) for key, pool in pools]
+
+
+class Statement(namedtuple("Statement", ["name", "query", "param_types", "row_type"], defaults=[NAMED_TUPLE])):
+    """SQL query with psycopg2 placeholders, which is prepared once per pooled connection"""
+
+    @property
+    def prepare_query(self):
+        placeholders = iter(range(1, len(self.param_types) + 1))
+        query = re.sub("%s", lambda _: "$%d" % next(placeholders), self.query)
+        if not self.param_types:
+            return "PREPARE %s AS %s" % (self.name, query)
+        return "PREPARE %s (%s) AS %s" % (self.name, ", ".join(self.param_types), query)
+
+    @property
+    def execute_query(self):
+        if not self.param_types:
+            return "EXECUTE %s" % self.name
+        return "EXECUTE %s (%s)" % (self.name, ", ".join(["%s"] * len(self.param_types)))
+
+
+STATEMENTS = {statement.name: statement for statement in [
+    Statement(
+        "check_connection",
+        "select * from information_schema.columns limit 1", ()),
+    Statement(
+        "get_column_names_for_table",
+        """select column_name, data_type from
+        information_schema.columns where table_name = %s""", ("text",)),
+    Statement(
+        "get_attribute_id",
+        "select id, name from attribute where name = %s", ("text",)),
+    Statement(
+        "get_project_attribute",
+        "select value from project_attribute where project_id = %s and attribute_id = %s",
+        ("bigint", "bigint")),
+    Statement(
+        "get_attribute_for_all_projects",
+        "select project_id, value from project_attribute where attribute_id = %s", ("bigint",)),
+    Statement(
+        "get_launch_ids",
+        "select item_id, launch_id from test_item where item_id = ANY(%s)", ("bigint[]",), SLOTS),
+    Statement(
+        "get_activities_by_project",
+        """select id, entity, action, details, object_id, creation_date from activity
+        where project_id = %s and creation_date >= %s and
+        creation_date <= %s order by creation_date""", ("bigint", "timestamp", "timestamp"), SLOTS),
+    Statement(
+        "get_activities_by_project_after_id",
+        """select id, entity, action, details, object_id, creation_date from activity
+        where project_id = %s and creation_date >= %s and
+        creation_date <= %s and id > %s order by creation_date""",
+        ("bigint", "timestamp", "timestamp", "bigint"), SLOTS),
+    Statement(
+        "get_transitions_by_project",
+        """select a.id, a.object_id, a.action, h.change ->> 'newValue', h.change ->> 'oldValue',
+        a.creation_date, ti.launch_id
+        from activity a
+        cross join lateral jsonb_array_elements(a.details::jsonb -> 'history') with ordinality as h(change, position)
+        left join test_item ti on ti.item_id = a.object_id and a.action in ('analyzeItem', 'updateItem')
+        where a.project_id = %s and a.creation_date >= %s and a.creation_date <= %s
+            and a.action in ('analyzeItem', 'updateItem', 'updateAnalyzer') and (
+            (a.action in ('analyzeItem', 'updateItem') and h.change ->> 'field' = 'issueType') or
+            (a.action = 'updateAnalyzer' and h.change ->> 'field' = 'analyzer.isAutoAnalyzerEnabled'))
+        order by a.creation_date, a.id, h.position""",
+        ("bigint", "timestamp", "timestamp")),
+    Statement(
+        "get_transitions_by_project_after_id",
+        """select a.id, a.object_id, a.action, h.change ->> 'newValue', h.change ->> 'oldValue',
+        a.creation_date, ti.launch_id
+        from activity a
+        cross join lateral jsonb_array_elements(a.details::jsonb -> 'history') with ordinality as h(change, position)
+        left join test_item ti on ti.item_id = a.object_id and a.action in ('analyzeItem', 'updateItem')
+        where a.project_id = %s and a.creation_date >= %s and a.creation_date <= %s and a.id > %s
+            and a.action in ('analyzeItem', 'updateItem', 'updateAnalyzer') and (
+            (a.action in ('analyzeItem', 'updateItem') and h.change ->> 'field' = 'issueType') or
+            (a.action = 'updateAnalyzer' and h.change ->> 'field' = 'analyzer.isAutoAnalyzerEnabled'))
+        order by a.creation_date, a.id, h.position""",
+        ("bigint", "timestamp", "timestamp", "bigint")),
+    Statement(
+        "count_unique_launches",
+        """select count(distinct id) from launch
+        where project_id = %s and start_time >= %s and
+        start_time <= %s""", ("bigint", "timestamp", "timestamp")),
+    Statement(
+        "get_all_projects",
+        "select id, name from project", ()),
+    Statement(
+        "get_all_unique_launch_ids",
+        """select id from launch
+        where project_id = %s and start_time >= %s and
+        start_time <= %s""", ("bigint", "timestamp", "timestamp")),
+    Statement(
+        "get_issue_type_dict",
+        """select it.locator, it.issue_name from issue_type_project as itp
+        inner join issue_type it on it.id = itp.issue_type_id where project_id = %s""", ("bigint",)),
+    Statement(
+        "get_issue_type_dicts",
+        """select itp.project_id, json_object_agg(it.issue_name, it.locator) as issue_types
+        from issue_type_project as itp
+        inner join issue_type it on it.id = itp.issue_type_id group by itp.project_id""", ()),
+    Statement(
+        "count_launches_by_day",
+        """select project_id, start_time::date as start_date, count(id) as launches from launch
+        where start_time >= %s and start_time < %s group by project_id, start_time::date""",
+        ("timestamp", "timestamp")),
+]}
+
+
+def execute_statement(cursor, statement, params=()):
+    """Execute the statement on the cursor, preparing it first if the connection hasn't done it yet"""
+    connection = cursor.connection
+    if statement.name not in connection.prepared_statements:
+        cursor.execute(statement.prepare_query)
+        connection.prepared_statements.add(statement.name)
+    try:
+        cursor.execute(statement.execute_query, params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # the session lost its prepared statements, e.g. after DISCARD ALL
+        connection.rollback()
+        connection.prepared_statements.clear()
+        cursor.execute(statement.prepare_query)
+        connection.prepared_statements.add(statement.name)
+        cursor.execute(statement.execute_query, params)
+
 
 class PostgresDAO:
 
     def __init__(self, app_settings):
         self.app_settings = app_settings
+        self.pool = get_connection_pool(app_settings)
+        self.batch_size = max(int(app_settings["postgresQueryBatchSize"]), 1)
+        self.launch_id_cache = LRUCache(app_settings["launchIdCacheSize"])
+        self.cursor_itersize = max(int(app_settings["postgresCursorItersize"]), 1)
         self.auto_analysis_attribute_id = self.get_auto_analysis_attribute_id()
 
-    def transform_to_objects(self, query, results):
-        try:
-            transformed_results = []
-            columns = [col.strip() for col in re.search(
-                "select (.*) from", query, flags=re.IGNORECASE).group(1).split(",")]
-            for r in results:
-                obj = {}
-                for idx, column in enumerate(columns):
-                    obj[column] = r[idx]
-                transformed_results.append(obj)
-            return transformed_results
-        except Exception as e:
-            logger.error("Didn't derive columns from query")
-            logger.error(e)
+    @staticmethod
+    def _fetch_all(connection, statement, params, derive_scheme):
+        with connection.cursor() as cursor:
+            execute_statement(cursor, statement, params)
+            results = cursor.fetchall()
+            if derive_scheme:
+                row_factory = create_row_factory(cursor.description, statement.row_type)
+                results = [row_factory(result) for result in results]
             return results
 
-    def query_db(self, query, query_all=True, derive_scheme=True):
-        connection = None
+    def query_db(self, statement_name, params=(), query_all=True, derive_scheme=True):
         final_results = None
         try:
-            connection = psycopg2.connect(user=self.app_settings["postgresUser"],
-                                          password=self.app_settings["postgresPassword"],
-                                          host=self.app_settings["postgresHost"],
-                                          port=self.app_settings["postgresPort"],
-                                          database=self.app_settings["postgresDatabase"])
-
-            cursor = connection.cursor()
-            cursor.execute(query)
-            results = cursor.fetchall()
-            results = self.transform_to_objects(query, results) if derive_scheme else results
+            statement = STATEMENTS[statement_name]
+            results = self.pool.execute(
+                lambda connection: self._fetch_all(connection, statement, params, derive_scheme))
             if query_all:
                 final_results = results
             if not query_all and len(results) > 0:
                 final_results = results[0]
         except (Exception, psycopg2.Error) as error:
             logger.error("Error while connecting to PostgreSQL %s", error)
-        finally:
-            if connection:
-                cursor.close()
-                connection.close()
         return final_results
 
+    def stream_query(self, statement_name, params=(), derive_scheme=True):
+        """Iterate over query results with a server-side cursor, which fetches only itersize rows at a time.
+
+        Unlike query_db, errors are logged and re-raised, so a partially read result is never taken as a whole.
+        """
+        try:
+            # cursors can't be declared for EXECUTE, so the streamed statements are bound, but not prepared
+            statement = STATEMENTS[statement_name]
+            with self.pool.connection() as connection:
+                with connection.cursor(name="metrics_gatherer_%s" % uuid.uuid4().hex) as cursor:
+                    cursor.itersize = self.cursor_itersize
+                    cursor.execute(statement.query, params)
+                    row_factory = None
+                    for row in cursor:
+                        if derive_scheme and row_factory is None:
+                            # named cursors get their description with the first fetched rows
+                            row_factory = create_row_factory(cursor.description, statement.row_type)
+                        yield row_factory(row) if row_factory else row
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while streaming results from PostgreSQL %s", error)
+            raise
+
+    @staticmethod
+    def _fetch_one(connection, statement):
+        with connection.cursor() as cursor:
+            execute_statement(cursor, statement)
+            return cursor.fetchone()
+
     def test_query_handling(self):
-        connection = None
         result = True
         try:
-            connection = psycopg2.connect(user=self.app_settings["postgresUser"],
-                                          password=self.app_settings["postgresPassword"],
-                                          host=self.app_settings["postgresHost"],
-                                          port=self.app_settings["postgresPort"],
-                                          database=self.app_settings["postgresDatabase"])
-
-            cursor = connection.cursor()
-            cursor.execute("select * from information_schema.columns")
-            result = cursor.fetchone() is not None
+            result = self.pool.execute(lambda connection: self._fetch_one(
+                connection, STATEMENTS["check_connection"])) is not None
         except (Exception, psycopg2.Error) as error:
             logger.error("Error while connecting to PostgreSQL %s", error)
             result = False
-        finally:
-            if connection:
-                cursor.close()
-                connection.close()
         return result
 
     def get_column_names_for_table(self, table_name):
-        return self.query_db(
-            """select column_name, data_type from
-            information_schema.columns where table_name = '%s';""" % table_name)
+        return self.query_db("get_column_names_for_table", (table_name,))
 
     def get_auto_analysis_attribute_id(self):
-        result = self.query_db(
-            """select id, name from attribute
-            where name = 'analyzer.isAutoAnalyzerEnabled'""", query_all=False)
+        result = self.query_db("get_attribute_id", ("analyzer.isAutoAnalyzerEnabled",), query_all=False)
         if result:
             return result["id"]
         return -1
 
     def is_auto_analysis_enabled_for_project(self, project_id):
         result = self.query_db(
-            "select value from project_attribute where project_id = %d and attribute_id = %d" % (
-                project_id, self.auto_analysis_attribute_id), query_all=False)
+            "get_project_attribute", (project_id, self.auto_analysis_attribute_id), query_all=False)
         if result:
             return result["value"].lower() == "true"
         return False
 
+    def get_auto_analysis_states(self):
+        """Get whether auto-analysis is enabled for every project which has this attribute"""
+        results = self.query_db("get_attribute_for_all_projects", (self.auto_analysis_attribute_id,))
+        if results is None:
+            return None
+        return {result["project_id"]: result["value"].lower() == "true" for result in results}
+
     def get_launch_id(self, item_id):
-        result = self.query_db(
-            "select launch_id from test_item where item_id=%d" % item_id, query_all=False)
-        if result:
-            return result["launch_id"]
-        return None
+        return self.get_launch_ids([item_id]).get(item_id)
+
+    def cache_launch_ids(self, launch_ids):
+        for item_id, launch_id in launch_ids:
+            self.launch_id_cache.put(item_id, launch_id)
+
+    def get_launch_ids(self, item_ids):
+        """Map test item ids to launch ids, querying in batches only the items missing in the cache"""
+        launch_ids = {}
+        missing_ids = []
+        for item_id in set(item_ids):
+            if item_id in self.launch_id_cache:
+                launch_ids[item_id] = self.launch_id_cache.get(item_id)
+            else:
+                missing_ids.append(item_id)
+        for i in range(0, len(missing_ids), self.batch_size):
+            batch_ids = missing_ids[i:i + self.batch_size]
+            results = self.query_db("get_launch_ids", (batch_ids,))
+            if results is None:
+                continue
+            found_launch_ids = {result["item_id"]: result["launch_id"] for result in results}
+            for item_id in batch_ids:
+                launch_id = found_launch_ids.get(item_id)
+                self.launch_id_cache.put(item_id, launch_id)
+                launch_ids[item_id] = launch_id
+        return launch_ids
 
     def get_activities_by_project(self, project_id, start_date, end_date):
-        return self.query_db(
-            """select entity, action, details, object_id, creation_date from activity
-            where project_id=%d and creation_date >= '%s'::timestamp and
-            creation_date <= '%s'::timestamp order by creation_date""" % (
-                project_id, start_date, end_date))
+        return list(self.iter_activities_by_project(project_id, start_date, end_date))
+
+    def iter_activities_by_project(self, project_id, start_date, end_date, after_id=None):
+        if after_id is not None:
+            return self.stream_query(
+                "get_activities_by_project_after_id", (project_id, start_date, end_date, after_id))
+        return self.stream_query("get_activities_by_project", (project_id, start_date, end_date))
+
+    def iter_transitions_by_project(self, project_id, start_date, end_date, after_id=None):
+        """Stream issue type and auto-analysis changes, extracted from the activity history by Postgres"""
+        if after_id is not None:
+            rows = self.stream_query(
+                "get_transitions_by_project_after_id", (project_id, start_date, end_date, after_id),
+                derive_scheme=False)
+        else:
+            rows = self.stream_query(
+                "get_transitions_by_project", (project_id, start_date, end_date), derive_scheme=False)
+        return (Transition._make(row) for row in rows)
 
     def get_all_projects(self):
-        return self.query_db("select id, name from project")
+        return self.query_db("get_all_projects")
 
     def get_all_unique_launch_ids(self, project_id, start_date, end_date):
-        all_ids = self.query_db(
-            """select id from launch
-            where project_id=%d and start_time >= '%s'::timestamp and
-            start_time <= '%s'::timestamp""" % (
-                project_id, start_date, end_date))
+        all_ids = self.query_db("get_all_unique_launch_ids", (project_id, start_date, end_date))
         return list(set([obj["id"] for obj in all_ids]))
 
+    def count_unique_launches(self, project_id, start_date, end_date):
+        result = self.query_db(
+            "count_unique_launches", (project_id, start_date, end_date), query_all=False, derive_scheme=False)
+        return result[0] if result else 0
+
+    def count_launches_by_day(self, start_date, end_date):
+        """Count the launches of all projects per day, None if the query failed"""
+        results = self.query_db("count_launches_by_day", (start_date, end_date))
+        if results is None:
+            return None
+        return {(result.project_id, result.start_date): result.launches for result in results}
+
     def get_issue_type_dict(self, project_id):
         issue_type_dict = {}
-        for issue_type_val in self.query_db(
-                """select it.locator, it.issue_name from issue_type_project as itp
-                inner join issue_type it on it.id = itp.issue_type_id where project_id=%s""" % project_id,
-                derive_scheme=True):
-            issue_type_dict[issue_type_val["it.issue_name"]] = issue_type_val["it.locator"]
+        for issue_type_val in self.query_db("get_issue_type_dict", (project_id,), derive_scheme=True):
+            issue_type_dict[issue_type_val.issue_name] = issue_type_val.locator
         return issue_type_dict
+
+    def get_issue_type_dicts(self):
+        """Get issue type names mapped to locators for all projects at once"""
+        results = self.query_db("get_issue_type_dicts")
+        if results is None:
+            return None
+        return {result.project_id: result.issue_types for result in results}
@@ -0,0 +1,81 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from collections import namedtuple
+from functools import lru_cache
+from typing import Callable, Sequence, Tuple
+
+NAMED_TUPLE = "named_tuple"
+SLOTS = "slots"
+
+
+def _named_tuple_getitem(self, key):
+    if isinstance(key, str):
+        return getattr(self, key)
+    return tuple.__getitem__(self, key)
+
+
+def _slots_init(self, values):
+    for field, value in zip(self.__slots__, values):
+        setattr(self, field, value)
+
+
+def _slots_getitem(self, key):
+    if isinstance(key, str):
+        return getattr(self, key)
+    return getattr(self, self.__slots__[key])
+
+
+def _slots_iter(self):
+    return (getattr(self, field) for field in self.__slots__)
+
+
+def _slots_eq(self, other):
+    if type(self) is not type(other):
+        return NotImplemented
+    return tuple(self) == tuple(other)
+
+
+def _slots_repr(self):
+    return "Row(%s)" % ", ".join("%s=%r" % (field, getattr(self, field)) for field in self.__slots__)
+
+
+def _keys(self):
+    return self._fields
+
+
+def _get(self, key, default=None):
+    return getattr(self, key) if key in self._fields else default
+
+
+@lru_cache(maxsize=256)
+def get_row_class(columns: Tuple[str, ...], row_type: str = NAMED_TUPLE) -> type:
+    """Create a row class for the columns, rows are accessible by column name, attribute and index"""
+    named_tuple_class = namedtuple("Row", columns, rename=True)
+    fields = named_tuple_class._fields
+    if row_type == SLOTS:
+        return type("Row", (), {
+            "__slots__": fields, "_fields": fields, "__init__": _slots_init, "__getitem__": _slots_getitem,
+            "__iter__": _slots_iter, "__len__": lambda self: len(fields), "__eq__": _slots_eq,
+            "__hash__": None, "__repr__": _slots_repr, "keys": _keys, "get": _get})
+    return type("Row", (named_tuple_class,), {
+        "__slots__": (), "__getitem__": _named_tuple_getitem, "keys": _keys, "get": _get})
+
+
+def create_row_factory(description: Sequence, row_type: str = NAMED_TUPLE) -> Callable[[Sequence], object]:
+    """Create a function which wraps result tuples of a cursor into row objects"""
+    row_class = get_row_class(tuple(column[0] for column in description), row_type)
+    if row_type == SLOTS:
+        return row_class
+    return row_class._make
@@ -18,14 +18,12 @@ import logging.config
 import os
 import threading
 import time
+from contextlib import contextmanager
 
-import schedule
 from flask import Flask, Response
 from flask import jsonify
 from flask_cors import CORS
 
-from app.commons import metrics_gatherer, es_client
-from app.commons import postgres_dao, amqp
 from app.utils import utils, text_processing
 
 APP_CONFIG = {
@@ -41,9 +39,28 @@ APP_CONFIG = {
     "postgresDatabase": os.getenv("POSTGRES_DB", "reportportal"),
     "postgresHost": os.getenv("POSTGRES_HOST", "localhost"),
     "postgresPort": os.getenv("POSTGRES_PORT", 5432),
+    "postgresPoolMinSize": int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1")),
+    "postgresPoolMaxSize": int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10")),
+    "postgresPoolTimeout": int(os.getenv("POSTGRES_POOL_TIMEOUT", "60")),
+    "postgresPoolValidationInterval": int(os.getenv("POSTGRES_POOL_VALIDATION_INTERVAL", "30")),
+    "postgresPoolIdleTimeout": int(os.getenv("POSTGRES_POOL_IDLE_TIMEOUT", "300")),
+    "postgresQueryBatchSize": int(os.getenv("POSTGRES_QUERY_BATCH_SIZE", "1000")),
+    "launchIdCacheSize": int(os.getenv("LAUNCH_ID_CACHE_SIZE", "200000")),
+    "postgresCursorItersize": int(os.getenv("POSTGRES_CURSOR_ITERSIZE", "2000")),
+    "postgresAsyncConcurrency": int(os.getenv("POSTGRES_ASYNC_CONCURRENCY", "4")),
+    "incrementalActivityIngestion": json.loads(os.getenv("INCREMENTAL_ACTIVITY_INGESTION", "false").lower()),
+    "dailyPartialAggregates": json.loads(os.getenv("DAILY_PARTIAL_AGGREGATES", "false").lower()),
     "allowedStartTime": os.getenv("ALLOWED_START_TIME", "22:00"),
     "allowedEndTime": os.getenv("ALLOWED_END_TIME", "08:00"),
     "maxDaysStore": os.getenv("MAX_DAYS_STORE", "500"),
+    "esTimePartitionedIndices": json.loads(os.getenv("ES_TIME_PARTITIONED_INDICES", "false").lower()),
+    "esBulkRefresh": os.getenv("ES_BULK_REFRESH", "end_of_run").strip().lower(),
+    "esBulkBatchSize": int(os.getenv("ES_BULK_BATCH_SIZE", "1000")),
+    "esBulkBatchBytes": int(os.getenv("ES_BULK_BATCH_BYTES", "5242880")),
+    "esBulkQueueSize": int(os.getenv("ES_BULK_QUEUE_SIZE", "4")),
+    "esBulkWorkers": int(os.getenv("ES_BULK_WORKERS", "2")),
+    "esBulkMaxRetries": int(os.getenv("ES_BULK_MAX_RETRIES", "3")),
+    "esAsyncConcurrency": int(os.getenv("ES_ASYNC_CONCURRENCY", "4")),
     "timeInterval": os.getenv("TIME_INTERVAL", "hour").lower(),
     "turnOffSslVerification": json.loads(os.getenv("ES_TURN_OFF_SSL_VERIFICATION", "false").lower()),
     "esVerifyCerts": json.loads(os.getenv("ES_VERIFY_CERTS", "false").lower()),
@@ -68,13 +85,68 @@ APP_CONFIG = {
 }
 
 
+logger = logging.getLogger("metricsGatherer")
+
+GRAFANA_DASHBOARDS = ["X-WoMD5Mz", "7po7Ga1Gz", "OM3Zn8EMz"]
+
+
+class GrafanaProvisioning:
+    """State of the Grafana datasources and dashboards import, which runs in the background"""
+
+    NOT_CONFIGURED = "not configured"
+    IN_PROGRESS = "in progress"
+    DONE = "done"
+
+    def __init__(self):
+        self.status = self.NOT_CONFIGURED
+        self.attempts = 0
+        self.last_error = ""
+        self.lock = threading.Lock()
+
+    def update(self, status, error=""):
+        with self.lock:
+            self.status = status
+            self.last_error = error
+
+    def start_attempt(self):
+        with self.lock:
+            self.attempts += 1
+
+    def to_dict(self):
+        with self.lock:
+            return {"status": self.status, "attempts": self.attempts, "lastError": self.last_error}
+
+
+grafana_provisioning = GrafanaProvisioning()
+
+
+@contextmanager
+def startup_phase(name):
+    start_time = time.time()
+    yield
+    logger.info("Startup phase '%s' took %.3f s.", name, time.time() - start_time)
+
+
+def configure_logging():
+    log_file_path = 'res/logging.conf'
+    logging.config.fileConfig(log_file_path, defaults={'logfilename': APP_CONFIG["metricsPathToLog"]})
+    if APP_CONFIG["logLevel"].lower() == "debug":
+        logging.disable(logging.NOTSET)
+    elif APP_CONFIG["logLevel"].lower() == "info":
+        logging.disable(logging.DEBUG)
+    else:
+        logging.disable(logging.INFO)
+
+
 def create_application():
     """Creates a Flask application"""
     _application = Flask(__name__)
+    CORS(_application)
     return _application
 
 
 def start_metrics_gathering():
+    from app.commons import es_client, metrics_gatherer
     _es_client = es_client.EsClient(
         esHost=APP_CONFIG["esHost"], grafanaHost=APP_CONFIG["grafanaHost"], app_config=APP_CONFIG)
     if not utils.is_the_time_for_task_starting(APP_CONFIG["allowedStartTime"],
@@ -88,9 +160,13 @@ def start_metrics_gathering():
     if not _es_client.is_the_date_metrics_calculated(date_to_check):
         logger.debug("Task started...")
         _metrics = metrics_gatherer.MetricsGatherer(APP_CONFIG)
-        _metrics.gather_metrics(date_to_check,
-                                date_to_check)
+        all_written = _metrics.gather_metrics(date_to_check,
+                                              date_to_check)
         _es_client.delete_old_info(APP_CONFIG["maxDaysStore"])
+        if not all_written:
+            # the date isn't marked as done, so the next run writes the missing metrics
+            logger.error("Not all gathered metrics were written, the task will be repeated")
+            return
         _es_client.bulk_index(_es_client.task_done_index, [{
             '_index': _es_client.task_done_index,
             '_source': {
@@ -103,50 +179,50 @@ def start_metrics_gathering():
         logger.debug("Task for today was already completed...")
 
 
-log_file_path = 'res/logging.conf'
-logging.config.fileConfig(log_file_path, defaults={'logfilename': APP_CONFIG["metricsPathToLog"]})
-if APP_CONFIG["logLevel"].lower() == "debug":
-    logging.disable(logging.NOTSET)
-elif APP_CONFIG["logLevel"].lower() == "info":
-    logging.disable(logging.DEBUG)
-else:
-    logging.disable(logging.INFO)
-logger = logging.getLogger("metricsGatherer")
+def provision_grafana():
+    """Create the Grafana datasources and import the dashboards, retrying until it succeeds"""
+    if not APP_CONFIG["grafanaHost"].strip():
+        return
+    from app.commons import es_client
+    grafana_provisioning.update(GrafanaProvisioning.IN_PROGRESS)
+    while True:
+        grafana_provisioning.start_attempt()
+        try:
+            _es_client = es_client.EsClient(
+                esHost=APP_CONFIG["esHost"], grafanaHost=APP_CONFIG["grafanaHost"], app_config=APP_CONFIG)
+            data_source_created = []
+            for index in [_es_client.main_index, _es_client.rp_aa_stats_index,
+                          _es_client.rp_model_train_stats_index, _es_client.rp_suggest_metrics_index,
+                          _es_client.rp_model_remove_stats_index]:
+                date_field = "gather_date"
+                if index == _es_client.rp_suggest_metrics_index:
+                    date_field = "savedDate"
+                data_source_created.append(int(_es_client.create_grafana_data_source(
+                    APP_CONFIG["esHostGrafanaDataSource"], index, date_field)))
+            if sum(data_source_created) == len(data_source_created):
+                for dashboard_id in GRAFANA_DASHBOARDS:
+                    _es_client.import_dashboard(dashboard_id)
+                    logger.info("Imported dashboard '%s' into Grafana %s" % (
+                        dashboard_id, text_processing.remove_credentials_from_url(
+                            APP_CONFIG["grafanaHost"])))
+                grafana_provisioning.update(GrafanaProvisioning.DONE)
+                return
+            grafana_provisioning.update(GrafanaProvisioning.IN_PROGRESS, "Not all datasources were created")
+        except Exception as e:
+            logger.error(e)
+            logger.error("Can't import dashboard into Grafana %s" % text_processing.remove_credentials_from_url(
+                APP_CONFIG["grafanaHost"]))
+            grafana_provisioning.update(GrafanaProvisioning.IN_PROGRESS, str(e))
+        time.sleep(10)
 
-application = create_application()
-CORS(application)
 
-while True:
-    try:
-        if not APP_CONFIG["grafanaHost"].strip():
-            break
-        _es_client = es_client.EsClient(
-            esHost=APP_CONFIG["esHost"], grafanaHost=APP_CONFIG["grafanaHost"], app_config=APP_CONFIG)
-        data_source_created = []
-        for index in [_es_client.main_index, _es_client.rp_aa_stats_index,
-                      _es_client.rp_model_train_stats_index, _es_client.rp_suggest_metrics_index,
-                      _es_client.rp_model_remove_stats_index]:
-            date_field = "gather_date"
-            if index == _es_client.rp_suggest_metrics_index:
-                date_field = "savedDate"
-            data_source_created.append(int(_es_client.create_grafana_data_source(
-                APP_CONFIG["esHostGrafanaDataSource"], index, date_field)))
-        if sum(data_source_created) == len(data_source_created):
-            for dashboard_id in ["X-WoMD5Mz", "7po7Ga1Gz", "OM3Zn8EMz"]:
-                _es_client.import_dashboard(dashboard_id)
-                logger.info("Imported dashboard '%s' into Grafana %s" % (
-                    dashboard_id, text_processing.remove_credentials_from_url(
-                        APP_CONFIG["grafanaHost"])))
-            break
-    except Exception as e:
-        logger.error(e)
-        logger.error("Can't import dashboard into Grafana %s" % text_processing.remove_credentials_from_url(
-            APP_CONFIG["grafanaHost"]))
-        time.sleep(10)
+application = create_application()
 
 
 @application.route('/', methods=['GET'])
 def get_health_status():
+    """Check the services needed for the metrics gathering, Grafana is reported by its provisioning state only"""
+    from app.commons import amqp, es_client, postgres_dao
     _es_client = es_client.EsClient(
         esHost=APP_CONFIG["esHost"], grafanaHost=APP_CONFIG["grafanaHost"], app_config=APP_CONFIG)
     _postgres_dao = postgres_dao.PostgresDAO(APP_CONFIG)
@@ -154,8 +230,6 @@ def get_health_status():
     status = ""
     if not _es_client.is_healthy():
         status += "Elasticsearch is not healthy;"
-    if APP_CONFIG["grafanaHost"].strip() and not _es_client.is_grafana_healthy():
-        status += "Grafana is not healthy;"
     if not _postgres_dao.test_query_handling():
         status += "Postgres is not healthy;"
     if APP_CONFIG["amqpUrl"].strip():
@@ -166,18 +240,27 @@ def get_health_status():
             status += "Connection to Rabbitmq is not healthy;"
     if status:
         logger.error("Metrics gatherer health check status failed: %s", status)
-        return Response(json.dumps({"status": status}), status=503, mimetype='application/json')
-    return jsonify({"status": "healthy"})
+        return Response(json.dumps({"status": status, "grafanaProvisioning": grafana_provisioning.to_dict()}),
+                        status=503, mimetype='application/json')
+    return jsonify({"status": "healthy", "grafanaProvisioning": grafana_provisioning.to_dict()})
+
 
+@application.route('/stats', methods=['GET'])
+def get_stats():
+    from app.commons import es_client, postgres_dao
+    return jsonify({"postgresPools": postgres_dao.get_pools_stats(),
+                    "elasticsearchClients": es_client.get_clients_stats()})
 
-def create_thread(func, args):
+
+def create_thread(func, args, daemon=False):
     """Creates a thread with specified function and arguments"""
-    thread = threading.Thread(target=func, args=args)
+    thread = threading.Thread(target=func, args=args, daemon=daemon)
     thread.start()
     return thread
 
 
 def scheduling_tasks():
+    import schedule
     logger.info("Started scheduling of metrics gathering...")
     allowed_intervals = {
         "hour": schedule.every().hour.do,
@@ -202,9 +285,31 @@ def start_http_server():
     application.run(host='0.0.0.0', port=APP_CONFIG["metricsHttpPort"])
 
 
-create_thread(scheduling_tasks, ())
+def start_service():
+    """Start the service in phases: logging, then the background tasks, none of them waits for other services"""
+    start_time = time.time()
+    with startup_phase("logging"):
+        configure_logging()
+    with startup_phase("grafana provisioning"):
+        create_thread(provision_grafana, (), daemon=True)
+    with startup_phase("scheduler"):
+        create_thread(scheduling_tasks, ())
+    logger.info("Metrics gatherer started for %.3f s.", time.time() - start_time)
+
+
+def is_served_by_uwsgi():
+    try:
+        import uwsgi  # noqa: F401 the module is available only inside uWSGI workers
+        return True
+    except ImportError:
+        return False
+
+
+if is_served_by_uwsgi():
+    start_service()
 
 if __name__ == '__main__':
+    start_service()
     logger.info("Program started")
 
     start_http_server()
@@ -0,0 +1,47 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def confusion_matrix(y_true: Sequence, y_pred: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the sorted labels of both sequences and the matrix of true (rows) by predicted (columns) counts"""
+    if len(y_true) != len(y_pred):
+        raise ValueError("Found input variables with inconsistent numbers of samples: [%d, %d]"
+                         % (len(y_true), len(y_pred)))
+    labels, encoded = np.unique(np.concatenate([np.asarray(y_true), np.asarray(y_pred)]), return_inverse=True)
+    n_labels = len(labels)
+    true_codes, pred_codes = encoded[:len(y_true)], encoded[len(y_true):]
+    matrix = np.bincount(true_codes * n_labels + pred_codes, minlength=n_labels * n_labels)
+    return labels, matrix.reshape(n_labels, n_labels)
+
+
+def accuracy_score(y_true: Sequence, y_pred: Sequence) -> float:
+    """Share of the correctly predicted labels, as sklearn.metrics.accuracy_score"""
+    _, matrix = confusion_matrix(y_true, y_pred)
+    return float(np.trace(matrix) / matrix.sum())
+
+
+def f1_score(y_true: Sequence, y_pred: Sequence, average: str = "macro") -> float:
+    """Macro averaged F1 score, as sklearn.metrics.f1_score with zero_division="warn" (without the warning)"""
+    if average != "macro":
+        raise ValueError("Only the macro average is supported, got '%s'" % average)
+    _, matrix = confusion_matrix(y_true, y_pred)
+    tp_sum = np.diag(matrix).astype(np.float64)
+    denominator = matrix.sum(axis=1) + matrix.sum(axis=0)
+    # a label with no true positives has the F1 score 0, the same as sklearn sets for zero division
+    f_score = np.divide(2 * tp_sum, denominator, out=np.zeros_like(tp_sum), where=denominator != 0)
+    return float(np.average(f_score))
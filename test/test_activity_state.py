@@ -0,0 +1,68 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+from datetime import datetime
+
+from app.commons import activity_state
+from app.commons.activity_transitions import Transition, extract_transitions
+
+
+class TestActivityState(unittest.TestCase):
+
+    transitions = [
+        Transition(10, 1, "analyzeItem", "Product Bug", "To Investigate", datetime(2020, 10, 10, 5, 1, 2, 345)),
+        Transition(12, 1, "updateItem", "System Issue", "Product Bug", datetime(2020, 10, 12, 7)),
+        Transition(15, 5, "updateAnalyzer", "false", "true", datetime(2020, 10, 14, 9))]
+
+    def test_extract_transitions(self):
+        assert list(extract_transitions([
+            {"id": 10, "object_id": 1, "action": "analyzeItem", "creation_date": datetime(2020, 10, 10, 5, 1, 2, 345),
+             "details": {"history": [
+                 {"field": "comment", "oldValue": "", "newValue": "text"},
+                 {"field": "issueType", "oldValue": "To Investigate", "newValue": "Product Bug"}]}},
+            {"id": 11, "object_id": 2, "action": "startLaunch", "creation_date": datetime(2020, 10, 11),
+             "details": {"history": []}},
+            {"id": 12, "object_id": 1, "action": "updateItem", "creation_date": datetime(2020, 10, 12, 7),
+             "details": {"history": [
+                 {"field": "issueType", "oldValue": "Product Bug", "newValue": "System Issue"}]}},
+            {"id": 15, "object_id": 5, "action": "updateAnalyzer", "creation_date": datetime(2020, 10, 14, 9),
+             "details": {"history": [
+                 {"field": "analyzer.isAutoAnalyzerEnabled", "oldValue": "true", "newValue": "false"}]}}
+        ])) == self.transitions
+
+    def test_transitions_recorder_failed_stream(self):
+        def broken_stream():
+            yield self.transitions[0]
+            raise ConnectionError("connection is lost")
+
+        recorder = activity_state.TransitionsRecorder(broken_stream(), datetime(2020, 10, 11), 9)
+        with self.assertRaises(ConnectionError):
+            list(recorder)
+        assert recorder.failed
+        assert not recorder.completed
+        assert recorder.last_activity_id == 10
+
+    def test_encode_decode_transitions(self):
+        encoded = activity_state.encode_transitions(self.transitions)
+        assert isinstance(encoded, str)
+        assert activity_state.decode_transitions(encoded) == self.transitions
+
+    def test_transitions_recorder(self):
+        recorder = activity_state.TransitionsRecorder(iter(self.transitions), datetime(2020, 10, 11), 9)
+        assert list(recorder) == self.transitions
+        assert recorder.finished
+        assert recorder.completed
+        assert recorder.get_state() == activity_state.ActivityState(
+            15, datetime(2020, 10, 11), self.transitions[1:])
@@ -0,0 +1,42 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+from datetime import datetime, timedelta
+
+from app.commons.activity_window import ActivityWindow
+
+
+class TestActivityWindow(unittest.TestCase):
+
+    def test_slide(self):
+        rows_read = []
+
+        def read_rows():
+            for day in range(10):
+                row = {"object_id": day, "creation_date": datetime(2020, 10, 1, 12) + timedelta(days=day)}
+                rows_read.append(row)
+                yield row
+
+        window = ActivityWindow(read_rows())
+        assert [row["object_id"] for row in window.slide(
+            datetime(2020, 10, 1), datetime(2020, 10, 3))] == [0, 1]
+        assert len(rows_read) == 3
+        assert [row["object_id"] for row in window.slide(
+            datetime(2020, 10, 2), datetime(2020, 10, 5))] == [1, 2, 3]
+        assert [row["object_id"] for row in window.slide(
+            datetime(2020, 10, 7), datetime(2020, 10, 8, 12))] == [6, 7]
+        assert [row["object_id"] for row in window.slide(
+            datetime(2020, 10, 9), datetime(2020, 10, 20))] == [8, 9]
+        assert len(rows_read) == 10
@@ -0,0 +1,87 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import unittest
+from unittest.mock import MagicMock
+
+from app.commons.bulk_writer import BulkWriter
+
+
+class TestBulkWriter(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_app_config(self):
+        return {
+            "esBulkRefresh": "end_of_run",
+            "esBulkBatchSize": 2,
+            "esBulkBatchBytes": 5242880,
+            "esBulkQueueSize": 2,
+            "esBulkWorkers": 2
+        }
+
+    def get_actions(self, count, index_name="rp_stats"):
+        return [{"_id": str(i), "_index": index_name, "_source": {"value": i}} for i in range(count)]
+
+    def test_batches_are_sent_when_full_and_on_flush(self):
+        es_client = MagicMock()
+        es_client.bulk_index.return_value = 0
+        writer = BulkWriter(es_client, self.get_app_config())
+        writer.bulk_index("rp_stats", self.get_actions(5))
+        writer.bulk_index("rp_activity_state", self.get_actions(1, "rp_activity_state"))
+        assert writer.flush() == 0
+        sent = sorted((call[0][0], len(call[0][1])) for call in es_client.bulk_index.call_args_list)
+        assert sent == [("rp_activity_state", 1), ("rp_stats", 1), ("rp_stats", 2), ("rp_stats", 2)]
+        assert all(call[1]["refresh"] is False for call in es_client.bulk_index.call_args_list)
+        assert sorted(call[0][0] for call in es_client.refresh_index.call_args_list) == [
+            "rp_activity_state", "rp_stats"]
+        assert writer.stats["docs"] == 6
+        writer.close()
+
+    def test_batches_are_limited_by_bytes(self):
+        es_client = MagicMock()
+        es_client.bulk_index.return_value = 0
+        app_config = self.get_app_config()
+        app_config["esBulkBatchSize"] = 100
+        app_config["esBulkBatchBytes"] = 1
+        app_config["esBulkRefresh"] = "wait_for"
+        writer = BulkWriter(es_client, app_config)
+        writer.bulk_index("rp_stats", self.get_actions(3))
+        writer.close()
+        assert es_client.bulk_index.call_count == 3
+        assert es_client.bulk_index.call_args[1]["refresh"] == "wait_for"
+        es_client.refresh_index.assert_not_called()
+
+    def test_failed_docs_are_reported_by_flush(self):
+        es_client = MagicMock()
+        es_client.bulk_index.side_effect = lambda index_name, actions, refresh: {
+            "rp_stats": 1, "rp_activity_state": 0}.get(index_name, len(actions))
+        writer = BulkWriter(es_client, self.get_app_config())
+        writer.bulk_index("rp_stats", self.get_actions(3))
+        writer.bulk_index("rp_activity_state", self.get_actions(1, "rp_activity_state"))
+        writer.bulk_index("rp_aa_stats", self.get_actions(1, "rp_aa_stats"))
+        assert writer.flush() == 3
+        assert writer.stats == {"docs": 2, "batches": 1, "failed_docs": 3, "failed_batches": 3}
+        es_client.bulk_index.side_effect = Exception("ConnectionTimeout")
+        writer.bulk_index("rp_stats", self.get_actions(2))
+        assert writer.flush() == 2
+        assert writer.stats["failed_docs"] == 5
+        es_client.bulk_index.side_effect = None
+        assert writer.flush() == 0
+        writer.close()
@@ -0,0 +1,82 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import random
+import unittest
+
+from app.commons.chain_metrics import calculate_chain_metrics
+
+
+def calculate_chain_metrics_by_item(item_chain):
+    """The item by item implementation, which the vectorized one should match"""
+    cnt_changed = 0
+    cnt_all_analyzed = 0
+    analyzed_test_item_types = []
+    real_test_item_types = []
+    analyzed_items = []
+    manually_analyzed_cnt = 0
+    for item in item_chain:
+        was_analyzed = False
+        analyzed_test_item_type = None
+        real_test_item_type = None
+        for action in item_chain[item]:
+            if action[0] == "manual" and action[2][:2].lower() == "ti":
+                manually_analyzed_cnt += 1
+            if action[0] == "manual" and (action[1][:2].lower() == "ti" or action[2][:2].lower() == "ti"):
+                continue
+            if action[0] == "analyze":
+                was_analyzed = True
+            if was_analyzed and action[0] == "manual":
+                cnt_changed += 1
+                break
+        for action in item_chain[item]:
+            if action[0] == "analyze":
+                analyzed_test_item_type = action[1]
+                real_test_item_type = None
+            if was_analyzed and action[0] == "manual":
+                real_test_item_type = action[1]
+        if was_analyzed:
+            cnt_all_analyzed += 1
+            analyzed_items.append(item)
+        if analyzed_test_item_type is None:
+            continue
+        analyzed_test_item_types.append(analyzed_test_item_type)
+        real_test_item_types.append(
+            real_test_item_type if real_test_item_type is not None else analyzed_test_item_type)
+    return (cnt_all_analyzed, cnt_changed, manually_analyzed_cnt, analyzed_items,
+            analyzed_test_item_types, real_test_item_types)
+
+
+class TestChainMetrics(unittest.TestCase):
+
+    def test_chain_metrics(self):
+        assert tuple(calculate_chain_metrics({
+            1: [('analyze', 'pb001'), ('manual', 'ab001', 'pb001')],
+            2: [('manual', 'si001', 'ab001'), ('analyze', 'pb001')],
+            3: [('manual', 'pb001', 'ti001'), ('analyze', 'ab001'), ('manual', 'ti001', 'ab001')],
+            4: [('manual', 'pb001', 'TI001')]})) == (
+            3, 1, 2, [1, 2, 3], ['pb001', 'pb001', 'ab001'], ['ab001', 'pb001', 'ti001'])
+        assert tuple(calculate_chain_metrics({})) == (0, 0, 0, [], [], [])
+
+    def test_matches_item_by_item_calculation(self):
+        rng = random.Random(42)
+        issue_types = ["ti001", "TI_custom", "pb001", "ab001", "si001", "nd001", "Product Bug"]
+        for _ in range(50):
+            item_chain = {}
+            for item in range(rng.randint(0, 40)):
+                item_chain[item] = [
+                    ("analyze", rng.choice(issue_types)) if rng.random() < 0.4
+                    else ("manual", rng.choice(issue_types), rng.choice(issue_types))
+                    for _ in range(rng.randint(0, 6))]
+            assert tuple(calculate_chain_metrics(item_chain)) == calculate_chain_metrics_by_item(item_chain)
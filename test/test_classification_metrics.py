@@ -0,0 +1,66 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import random
+import unittest
+import warnings
+
+from app.utils import classification_metrics
+
+
+class TestClassificationMetrics(unittest.TestCase):
+
+    def test_confusion_matrix(self):
+        labels, matrix = classification_metrics.confusion_matrix(
+            ["pb001", "ab001", "pb001"], ["pb001", "si001", "ab001"])
+        assert labels.tolist() == ["ab001", "pb001", "si001"]
+        assert matrix.tolist() == [[0, 0, 1], [1, 1, 0], [0, 0, 0]]
+
+    def test_accuracy_and_f1_score(self):
+        y_true = ["ab001", "pb001"]
+        y_pred = ["pb001", "pb001"]
+        assert classification_metrics.accuracy_score(y_true, y_pred) == 0.5
+        # "ab001" is never predicted correctly, so its F1 score is 0
+        assert classification_metrics.f1_score(y_true, y_pred, average="macro") == 1 / 3
+        assert classification_metrics.f1_score(["si001"], ["si001"]) == 1.0
+        with self.assertRaises(ValueError):
+            classification_metrics.f1_score(y_true, y_pred, average="micro")
+
+    def test_edge_cases_match_sklearn(self):
+        # the expected values were calculated with sklearn.metrics 1.5.0
+        cases = [
+            # "ab001" and "si001" are never predicted
+            (["pb001", "ab001", "si001", "pb001"], ["pb001", "pb001", "pb001", "pb001"], 0.5, 0.2222222222222222),
+            # every class has zero division either in precision or in recall
+            (["ti001", "ti001", "ti001"], ["pb001", "ab001", "si001"], 0.0, 0.0),
+            (["pb001"], ["ab001"], 0.0, 0.0),
+            (["nd001", "nd001", "pb001", "si001", "ab001"], ["nd001", "ab001", "pb001", "pb001", "ab001"], 0.6, 0.5),
+            (["pb001", "pb001"], ["pb001", "pb001"], 1.0, 1.0)]
+        for y_true, y_pred, accuracy, f1 in cases:
+            assert classification_metrics.accuracy_score(y_true, y_pred) == accuracy
+            assert classification_metrics.f1_score(y_true, y_pred, average="macro") == f1
+
+    def test_matches_sklearn(self):
+        from sklearn.metrics import accuracy_score, f1_score
+        rng = random.Random(7)
+        labels = ["ti001", "pb001", "ab001", "si001", "nd001", "pb_custom"]
+        for _ in range(200):
+            size = rng.randint(1, 30)
+            y_true = [rng.choice(labels) for _ in range(size)]
+            y_pred = [rng.choice(labels) for _ in range(size)]
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                assert classification_metrics.accuracy_score(y_true, y_pred) == accuracy_score(y_true, y_pred)
+                assert classification_metrics.f1_score(y_true, y_pred, average="macro") == f1_score(
+                    y_true, y_pred, average="macro")
@@ -0,0 +1,122 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import unittest
+from datetime import date, datetime
+from unittest.mock import MagicMock
+
+from app.commons.daily_partials import DailyPartialsStore, get_window_days, merge_partials
+
+
+def method_stats(count, percent_not_found, model_info, errors_count=0):
+    return {"percent_not_found": percent_not_found, "count": count,
+            "avg_time_only_found_test_item_processed": 0.5 * count,
+            "avg_time_test_item_processed": 0.25 * count,
+            "model_info": model_info, "module_version": ["1.1.1"],
+            "errors": ["error"] * errors_count, "errors_count": errors_count}
+
+
+class TestDailyPartials(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def create_store(self, saved_days=None):
+        es_client = MagicMock()
+        es_client.daily_partials_index = "rp_stats_partials"
+        saved_docs = saved_days or {}
+        es_client.get_documents.side_effect = lambda index_name, ids: {
+            doc_id: saved_docs[doc_id] for doc_id in ids if doc_id in saved_docs}
+        es_client.aggregate_activities.side_effect = lambda day_start, day_end, **kwargs: {
+            "1": {"methods": {"auto_analysis": method_stats(1, 10.0, ["global_model"])},
+                  "launch_analyzed": 1, "launch_ids": [day_start.day]}}
+        postgres_dao = MagicMock()
+        postgres_dao.count_launches_by_day.side_effect = lambda day_start, day_end: {
+            (1, day_start.date()): 2, (2, day_start.date()): 1}
+        return DailyPartialsStore(es_client, postgres_dao)
+
+    def test_get_window_days(self):
+        days = get_window_days(datetime(2020, 10, 17, 22, 30))
+        assert len(days) == 8
+        assert days[0] == date(2020, 10, 10)
+        assert days[-1] == date(2020, 10, 17)
+
+    def test_merge_partials(self):
+        assert merge_partials([
+            {"methods": {"auto_analysis": method_stats(2, 20.0, ["global_model"], errors_count=1)},
+             "launch_ids": [1, 2], "launch_added": 3},
+            {"methods": {"auto_analysis": method_stats(1, 10.0, ["global_model"]),
+                         "suggest": method_stats(1, 5.0, [])},
+             "launch_ids": [2, 3]},
+            {"methods": {}, "launch_added": 1}]) == {
+            "methods": {
+                "auto_analysis": {
+                    "percent_not_found": 30.0, "count": 3,
+                    "avg_time_only_found_test_item_processed": 1.5, "avg_time_test_item_processed": 0.75,
+                    "model_info": ["global_model"], "module_version": ["1.1.1"],
+                    "errors": ["error"], "errors_count": 1},
+                "suggest": method_stats(1, 5.0, [])},
+            "launch_analyzed": 3, "launch_added": 4}
+
+    def test_only_finished_days_are_saved(self):
+        store = self.create_store(saved_days={
+            "2020-10-10": {"gather_date": "2020-10-10", "project_ids": ["1"]},
+            "1_2020-10-10": {"project_id": "1", "partial": {
+                "methods": {"auto_analysis": method_stats(1, 50.0, ["custom_model"])},
+                "launch_ids": [100], "launch_added": 5}}})
+        window_stats = store.get_window_stats(datetime(2020, 10, 17), now=datetime(2020, 10, 17, 22, 0))
+        assert store.es_client.get_documents.call_args_list[1][0][1] == ["1_2020-10-10"]
+        # 7 days are aggregated, only the gather date is still going on
+        assert store.es_client.aggregate_activities.call_count == 7
+        assert store.es_client.bulk_index.call_count == 6
+        saved_docs = store.es_client.bulk_index.call_args[0][1]
+        assert [doc["_id"] for doc in saved_docs] == ["1_2020-10-16", "2_2020-10-16", "2020-10-16"]
+        assert saved_docs[1]["_source"]["partial"] == {"methods": {}, "launch_ids": [], "launch_added": 1}
+        assert saved_docs[2]["_source"]["project_ids"] == ["1", "2"]
+        assert window_stats["1"]["methods"]["auto_analysis"]["count"] == 8
+        assert sorted(window_stats["1"]["methods"]["auto_analysis"]["model_info"]) == [
+            "custom_model", "global_model"]
+        assert window_stats["1"]["launch_analyzed"] == 8
+        assert window_stats["1"]["launch_added"] == 19
+        assert window_stats["2"] == {"methods": {}, "launch_analyzed": 0, "launch_added": 7}
+
+    def test_days_are_shared_by_the_gathered_dates(self):
+        store = self.create_store()
+        store.get_window_stats(datetime(2020, 10, 16), now=datetime(2020, 10, 18))
+        store.get_window_stats(datetime(2020, 10, 17), now=datetime(2020, 10, 18))
+        assert store.es_client.aggregate_activities.call_count == 9
+        assert store.es_client.get_documents.call_args_list[-2][0][1] == ["2020-10-17"]
+
+    def test_day_with_missing_project_is_aggregated_again(self):
+        store = self.create_store(saved_days={
+            "2020-10-16": {"gather_date": "2020-10-16", "project_ids": ["1", "2"]},
+            "1_2020-10-16": {"project_id": "1", "partial": {"methods": {}, "launch_ids": [], "launch_added": 9}},
+            "2020-10-15": {"projects": {"2": {"methods": {}, "launch_ids": [], "launch_added": 4}}}})
+        day_partials = store.get_day_partials(
+            [date(2020, 10, 15), date(2020, 10, 16)], now=datetime(2020, 10, 18))
+        # the day saved in one document by the previous versions is still read
+        assert day_partials[date(2020, 10, 15)] == {"2": {"methods": {}, "launch_ids": [], "launch_added": 4}}
+        assert day_partials[date(2020, 10, 16)]["1"]["launch_added"] == 2
+        store.es_client.aggregate_activities.assert_called_once()
+
+    def test_failed_aggregation(self):
+        store = self.create_store()
+        store.postgres_dao.count_launches_by_day.side_effect = None
+        store.postgres_dao.count_launches_by_day.return_value = None
+        assert store.get_window_stats(datetime(2020, 10, 17)) is None
+        store.es_client.bulk_index.assert_not_called()
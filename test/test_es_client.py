@@ -0,0 +1,303 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import concurrent.futures
+import logging
+import unittest
+from datetime import datetime
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+import elasticsearch.exceptions
+import elasticsearch.helpers
+
+from app.commons import es_client
+
+
+class TestEsClient(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_app_config(self):
+        return {
+            "esHost": "http://localhost:9200",
+            "grafanaHost": "http://localhost:3000",
+            "turnOffSslVerification": False,
+            "esVerifyCerts": False,
+            "esUseSsl": False,
+            "esSslShowWarn": False,
+            "esCAcert": "",
+            "esClientCert": "",
+            "esClientKey": "",
+            "esUser": "",
+            "esPassword": "",
+            "esTimePartitionedIndices": False,
+            "esBulkRefresh": "end_of_run",
+            "esBulkBatchSize": 2,
+            "esBulkBatchBytes": 5242880,
+            "esBulkQueueSize": 2,
+            "esBulkWorkers": 2,
+            "esBulkMaxRetries": 0,
+            "esAsyncConcurrency": 2
+        }
+
+    def create_client(self, partitioned=False):
+        app_config = self.get_app_config()
+        app_config["esTimePartitionedIndices"] = partitioned
+        _es_client = es_client.EsClient(app_config["esHost"], app_config["grafanaHost"], app_config)
+        _es_client.es_client = MagicMock()
+        return _es_client
+
+    def test_bulk_index_reuses_index_metadata(self):
+        _es_client = self.create_client()
+        with patch("elasticsearch.helpers.bulk", return_value=(1, [])) as bulk, \
+                patch("app.utils.utils.read_json_file", return_value={"properties": {}}) as read_json_file:
+            for _ in range(3):
+                assert _es_client.bulk_index("rp_stats", [{"_index": "rp_stats", "_source": {}}]) == 0
+        assert bulk.call_count == 3
+        read_json_file.assert_called_once()
+        _es_client.es_client.indices.get.assert_called_once_with(index="rp_stats")
+        _es_client.es_client.indices.put_mapping.assert_called_once()
+
+    def test_bulk_index_returns_failed_docs(self):
+        _es_client = self.create_client()
+        actions = [{"_index": "rp_stats", "_source": {}}, {"_index": "rp_stats", "_source": {}}]
+        with patch("app.utils.utils.read_json_file", return_value={"properties": {}}):
+            with patch("elasticsearch.helpers.bulk", side_effect=elasticsearch.helpers.BulkIndexError(
+                    "1 document(s) failed to index.", [{"index": {"status": 429}}])):
+                assert _es_client.bulk_index("rp_stats", actions) == 2
+            _es_client = self.create_client()
+            _es_client.es_client.indices.get.side_effect = Exception("index_not_found_exception")
+            _es_client.es_client.indices.create.side_effect = Exception("cluster_block_exception")
+            with patch("elasticsearch.helpers.bulk") as bulk:
+                assert _es_client.bulk_index("rp_stats", actions) == 2
+            bulk.assert_not_called()
+
+    def test_existing_index_is_created_once(self):
+        _es_client = self.create_client()
+        _es_client.es_client.indices.get.side_effect = Exception("index_not_found_exception")
+
+        def create_index(index, body):
+            sleep(0.05)
+            return {"acknowledged": True, "index": index}
+
+        _es_client.es_client.indices.create.side_effect = create_index
+        with patch("elasticsearch.helpers.bulk", return_value=(1, [])), \
+                patch("app.utils.utils.read_json_file", return_value={"properties": {}}):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                failed_counts = list(executor.map(lambda _: _es_client.bulk_index(
+                    "rp_stats", [{"_index": "rp_stats", "_source": {}}]), range(2)))
+        assert failed_counts == [0, 0]
+        _es_client.es_client.indices.create.assert_called_once()
+
+    def test_index_created_by_other_process_is_used(self):
+        _es_client = self.create_client()
+        _es_client.es_client.indices.get.side_effect = Exception("index_not_found_exception")
+        _es_client.es_client.indices.create.side_effect = elasticsearch.exceptions.RequestError(
+            400, "resource_already_exists_exception", {})
+        with patch("elasticsearch.helpers.bulk", return_value=(1, [])) as bulk, \
+                patch("app.utils.utils.read_json_file", return_value={"properties": {}}):
+            assert _es_client.bulk_index("rp_stats", [{"_index": "rp_stats", "_source": {}}]) == 0
+        bulk.assert_called_once()
+        assert _es_client.index_exists("rp_stats")
+
+    def test_created_index_needs_no_mapping_update(self):
+        _es_client = self.create_client()
+        _es_client.es_client.indices.get.side_effect = Exception("index_not_found_exception")
+        with patch("elasticsearch.helpers.bulk", return_value=(1, [])):
+            _es_client.bulk_index("rp_stats", [{"_index": "rp_stats", "_source": {}}])
+            _es_client.bulk_index("rp_stats", [{"_index": "rp_stats", "_source": {}}])
+        _es_client.es_client.indices.create.assert_called_once()
+        _es_client.es_client.indices.put_mapping.assert_not_called()
+        assert _es_client.index_exists("rp_stats")
+
+    def test_delete_index_invalidates_metadata(self):
+        _es_client = self.create_client()
+        assert _es_client.index_exists("rp_aa_stats")
+        assert _es_client.index_exists("rp_aa_stats")
+        _es_client.delete_index("rp_aa_stats")
+        _es_client.es_client.indices.get.side_effect = Exception("index_not_found_exception")
+        assert not _es_client.index_exists("rp_aa_stats", print_error=False)
+        assert _es_client.es_client.indices.get.call_count == 2
+
+    def test_get_existing_ids(self):
+        _es_client = self.create_client()
+        _es_client.es_client.mget.side_effect = [
+            {"docs": [{"_id": "1_2020-10-15", "found": True}, {"_id": "1_2020-10-16", "found": False}]},
+            {"docs": [{"_id": "2_2020-10-15", "found": True}]}]
+        assert _es_client.get_existing_ids(
+            "rp_stats", ["1_2020-10-15", "1_2020-10-16", "2_2020-10-15"], batch_size=2) == {
+            "1_2020-10-15", "2_2020-10-15"}
+        assert _es_client.es_client.mget.call_count == 2
+        _es_client.es_client.mget.side_effect = Exception("search_phase_execution_exception")
+        assert _es_client.get_existing_ids("rp_stats", ["1_2020-10-15"]) is None
+
+    def test_get_activities_streams_all_pages(self):
+        _es_client = self.create_client()
+        hits = [{"_source": {"method": "auto_analysis", "launch_id": i}} for i in range(3)]
+        with patch("elasticsearch.helpers.scan", return_value=iter(hits)) as scan:
+            activities = _es_client.get_activities(1, datetime(2020, 10, 9), datetime(2020, 10, 17), page_size=2)
+            scan.assert_not_called()
+            assert list(activities) == hits
+        assert scan.call_args[1]["size"] == 2
+        assert "launch_id" in scan.call_args[1]["query"]["_source"]
+        assert "size" not in scan.call_args[1]["query"]
+
+    def test_aggregate_activities(self):
+        _es_client = self.create_client()
+
+        def terms(*values):
+            return {"buckets": [{"key": value, "doc_count": 1} for value in values]}
+        _es_client.es_client.search.side_effect = [
+            {"aggregations": {"buckets": {"after_key": {"project_id": "1", "method": "suggest"}, "buckets": [
+                {"key": {"project_id": "1", "method": "suggest"}, "doc_count": 3, "processed": {
+                    "doc_count": 2, "percent_not_found": {"value": 185.0}, "avg_time_only_found": {"value": 0.0},
+                    "avg_time_all": {"value": 0.16}, "errors_count": {"value": 1.0},
+                    "errors": {"value": ["error 1"]}, "model_info": terms("global_model"),
+                    "module_version": terms("1.1.1")}}]}}},
+            {"aggregations": {"buckets": {"buckets": []}}},
+            {"aggregations": {"buckets": {"after_key": {"project_id": "1", "launch_id": 125}, "buckets": [
+                {"key": {"project_id": "1", "launch_id": 123}, "doc_count": 2},
+                {"key": {"project_id": "1", "launch_id": 125}, "doc_count": 1}]}}},
+            {"aggregations": {"buckets": {"buckets": []}}}]
+        assert _es_client.aggregate_activities(datetime(2020, 10, 9), datetime(2020, 10, 17)) == {
+            "1": {"methods": {"suggest": {
+                "percent_not_found": 185.0, "count": 2, "avg_time_only_found_test_item_processed": 0.0,
+                "avg_time_test_item_processed": 0.16, "model_info": ["global_model"],
+                "module_version": ["1.1.1"], "errors": ["error 1"], "errors_count": 1}},
+                "launch_analyzed": 2}}
+        second_page = _es_client.es_client.search.call_args_list[1][1]["body"]
+        assert second_page["aggs"]["buckets"]["composite"]["after"] == {"project_id": "1", "method": "suggest"}
+        _es_client.es_client.search.side_effect = Exception("script_exception")
+        assert _es_client.aggregate_activities(datetime(2020, 10, 9), datetime(2020, 10, 17)) is None
+
+    def test_aggregate_activities_of_a_day_with_launch_ids(self):
+        _es_client = self.create_client()
+        _es_client.es_client.search.side_effect = [
+            {"aggregations": {"buckets": {"buckets": [
+                {"key": {"project_id": "1", "method": "auto_analysis"}, "doc_count": 2, "processed": {
+                    "doc_count": 2, "percent_not_found": {"value": 10.0}, "avg_time_only_found": {"value": 0.5},
+                    "avg_time_all": {"value": 0.4}, "errors_count": {"value": 0.0},
+                    "errors": {"value": None}, "model_info": {"buckets": []},
+                    "module_version": {"buckets": []}}}]}}},
+            {"aggregations": {"buckets": {"buckets": [
+                {"key": {"project_id": "1", "launch_id": 123}, "doc_count": 1},
+                {"key": {"project_id": "1", "launch_id": 125}, "doc_count": 1}]}}}]
+        projects_stats = _es_client.aggregate_activities(
+            datetime(2020, 10, 16), datetime(2020, 10, 17), include_end=False, with_launch_ids=True)
+        assert projects_stats["1"]["launch_analyzed"] == 2
+        assert projects_stats["1"]["launch_ids"] == [123, 125]
+        date_range = _es_client.es_client.search.call_args_list[0][1]["body"]["query"]["bool"]["filter"][0]
+        assert date_range["range"]["gather_datetime"] == {
+            "gte": "2020-10-16 00:00:00", "lt": "2020-10-17 00:00:00"}
+
+    def test_get_documents(self):
+        _es_client = self.create_client()
+        _es_client.es_client.mget.return_value = {"docs": [
+            {"_id": "2020-10-16", "found": True, "_source": {"projects": {}}},
+            {"_id": "2020-10-17", "found": False}]}
+        assert _es_client.get_documents("rp_stats_partials", ["2020-10-16", "2020-10-17"]) == {
+            "2020-10-16": {"projects": {}}}
+        _es_client.es_client.mget.side_effect = lambda body, index: {"docs": [
+            {"_id": doc_id, "found": True, "_source": {}} for doc_id in body["ids"]]}
+        assert len(_es_client.get_documents("rp_stats_partials", [str(i) for i in range(5)], batch_size=2)) == 5
+        assert [len(call[1]["body"]["ids"]) for call in _es_client.es_client.mget.call_args_list[1:]] == [2, 2, 1]
+        _es_client.es_client.mget.side_effect = Exception("search_phase_execution_exception")
+        assert _es_client.get_documents("rp_stats_partials", ["2020-10-16"]) is None
+
+    def test_delete_old_info_starts_sliced_tasks(self):
+        _es_client = self.create_client()
+        _es_client.es_client.delete_by_query.side_effect = [{"task": "node:%d" % i} for i in range(7)]
+        with patch.object(es_client.EsClient, "wait_for_tasks") as wait_for_tasks:
+            tasks = _es_client.delete_old_info(30, poll_interval=0)
+        assert tasks["rp_stats"] == "node:0"
+        assert len(tasks) == 7
+        wait_for_tasks.assert_called_once_with(tasks, 0)
+        kwargs = _es_client.es_client.delete_by_query.call_args[1]
+        assert kwargs["slices"] == "auto"
+        assert not kwargs["wait_for_completion"]
+
+    def test_wait_for_tasks(self):
+        _es_client = self.create_client()
+        _es_client.es_client.tasks.get.side_effect = [
+            {"completed": False, "task": {"status": {"total": 10, "deleted": 4}}},
+            {"completed": True, "task": {"status": {"total": 10, "deleted": 10}}, "response": {"deleted": 10}}]
+        _es_client.wait_for_tasks({"rp_stats": "node:1"}, poll_interval=0)
+        assert _es_client.es_client.tasks.get.call_count == 2
+
+    def test_bulk_index_routes_documents_to_monthly_partitions(self):
+        _es_client = self.create_client(partitioned=True)
+        _es_client.es_client.indices.get.side_effect = Exception("index_not_found_exception")
+        _es_client.es_client.indices.create.return_value = {"acknowledged": True}
+        with patch("elasticsearch.helpers.bulk", return_value=(1, [])) as bulk:
+            _es_client.bulk_index("rp_stats", [
+                {"_id": "1_2020-09-30", "_index": "rp_stats", "_source": {"gather_date": "2020-09-30"}},
+                {"_id": "1_2020-10-01", "_index": "rp_stats", "_source": {"gather_date": "2020-10-01"}}])
+        created = [call[1]["index"] for call in _es_client.es_client.indices.create.call_args_list]
+        assert created == ["rp_stats-2020.09", "rp_stats-2020.10"]
+        assert _es_client.es_client.indices.create.call_args[1]["body"]["aliases"] == {"rp_stats-read": {}}
+        assert [call[0][1][0]["_index"] for call in bulk.call_args_list] == ["rp_stats-2020.09", "rp_stats-2020.10"]
+
+    def test_partitioned_reads(self):
+        _es_client = self.create_client(partitioned=True)
+        assert _es_client.get_read_index("rp_stats") == "rp_stats-read"
+        assert _es_client.get_read_index("rp_aa_stats") == "rp_aa_stats"
+        assert _es_client.get_search_indices("rp_stats", datetime(2020, 11, 25), datetime(2021, 1, 2)) == \
+            "rp_stats,rp_stats-2020.11,rp_stats-2020.12,rp_stats-2021.01"
+        _es_client.es_client.search.return_value = {"hits": {"hits": [{"_id": "1_2020-10-15"}]}}
+        assert _es_client.get_existing_ids("rp_stats", ["1_2020-10-15", "2_2020-10-15"]) == {"1_2020-10-15"}
+        assert _es_client.es_client.search.call_args[1]["index"] == "rp_stats-read"
+        _es_client.es_client.mget.assert_not_called()
+
+    def test_delete_old_partitions(self):
+        _es_client = self.create_client(partitioned=True)
+        _es_client.es_client.indices.get.return_value = {
+            "rp_stats-2020.08": {}, "rp_stats-2020.09": {}, "rp_stats-2020.10": {}}
+        _es_client.delete_old_partitions("rp_stats", datetime(2020, 10, 1))
+        assert [call[1]["index"] for call in _es_client.es_client.indices.delete.call_args_list] == [
+            "rp_stats-2020.08", "rp_stats-2020.09"]
+
+    def test_clients_share_elasticsearch_connections(self):
+        es_client.close_clients()
+        self.addCleanup(es_client.close_clients)
+        app_config = self.get_app_config()
+        first_client = es_client.EsClient(app_config["esHost"], app_config["grafanaHost"], app_config)
+        second_client = es_client.EsClient(app_config["esHost"], app_config["grafanaHost"], app_config)
+        other_client = es_client.EsClient("http://elasticsearch:9200", app_config["grafanaHost"], app_config)
+        assert first_client.es_client is second_client.es_client
+        assert first_client.es_client is not other_client.es_client
+        stats = es_client.get_clients_stats()
+        assert [(client["host"], client["es_client_objects"]) for client in stats] == [
+            ("http://localhost:9200", 2), ("http://elasticsearch:9200", 1)]
+        assert stats[0]["open_connections"] == 0
+        assert stats[0]["in_use_connections"] == 0
+        es_client.close_clients()
+        assert es_client.get_clients_stats() == []
+
+    def test_shared_client_counts_live_connections(self):
+        http_pool = MagicMock()
+        http_pool.num_connections = 5
+        # one connection is in use, one is idle and one was closed by the server
+        http_pool.pool.queue = [None, None, MagicMock(sock=object()), MagicMock(sock=None)]
+        http_pool.pool.maxsize = 5
+        connection = MagicMock(pool=http_pool)
+        shared_client = es_client.SharedEsClient(MagicMock())
+        shared_client.es_client.transport.connection_pool.connections = [connection]
+        assert shared_client.get_stats() == {
+            "es_client_objects": 0, "open_connections": 2, "in_use_connections": 1,
+            "idle_connections": 1, "opened_connections_total": 5}
@@ -0,0 +1,61 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import random
+import unittest
+
+from app.commons.chain_metrics import calculate_chain_metrics
+from app.commons.item_chains import ActionKind, ItemChains
+
+
+class TestItemChains(unittest.TestCase):
+
+    def test_to_dict(self):
+        item_chains = ItemChains()
+        item_chains.append(1, ActionKind.ANALYZE, "pb001")
+        item_chains.append(2, ActionKind.MANUAL, "si001", "ab001")
+        item_chains.append(1, ActionKind.MANUAL, "ab001", "pb001")
+        assert len(item_chains) == 2
+        assert 2 in item_chains and 3 not in item_chains
+        assert list(item_chains) == [1, 2]
+        assert item_chains.to_dict() == {
+            1: [('analyze', 'pb001'), ('manual', 'ab001', 'pb001')],
+            2: [('manual', 'si001', 'ab001')]}
+        assert dict(item_chains.vocabulary) == {"pb001": 0, "si001": 1, "ab001": 2}
+
+    def test_encode(self):
+        item_chains = ItemChains()
+        item_chains.append("b", ActionKind.MANUAL, "pb001", "ti001")
+        item_chains.append("a", ActionKind.ANALYZE, "ab001")
+        item_chains.append("b", ActionKind.ANALYZE, "si001")
+        items, lengths, is_manual, new_types, old_types, issue_types = item_chains.encode()
+        assert items == ["b", "a"]
+        assert lengths.tolist() == [2, 1]
+        assert is_manual.tolist() == [True, False, False]
+        assert issue_types[new_types].tolist() == ["pb001", "si001", "ab001"]
+        assert old_types.tolist() == [item_chains.vocabulary["ti001"], -1, -1]
+        assert tuple(calculate_chain_metrics(ItemChains())) == (0, 0, 0, [], [], [])
+
+    def test_metrics_match_dict_chains(self):
+        rng = random.Random(7)
+        issue_types = ["ti001", "pb001", "ab001", "si001", "nd001"]
+        for _ in range(30):
+            item_chains = ItemChains()
+            for _ in range(rng.randint(0, 100)):
+                if rng.random() < 0.4:
+                    item_chains.append(rng.randint(0, 20), ActionKind.ANALYZE, rng.choice(issue_types))
+                else:
+                    item_chains.append(rng.randint(0, 20), ActionKind.MANUAL,
+                                       rng.choice(issue_types), rng.choice(issue_types))
+            assert calculate_chain_metrics(item_chains) == calculate_chain_metrics(item_chains.to_dict())
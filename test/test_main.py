@@ -0,0 +1,57 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import threading
+import unittest
+from unittest.mock import patch
+
+from app import main
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def test_import_starts_no_background_tasks(self):
+        assert not [thread for thread in threading.enumerate() if thread.name != "MainThread"
+                    and getattr(thread, "_target", None) in (main.provision_grafana, main.scheduling_tasks)]
+        assert main.grafana_provisioning.to_dict()["status"] == main.GrafanaProvisioning.NOT_CONFIGURED
+
+    def test_provision_grafana(self):
+        provisioning = main.GrafanaProvisioning()
+        with patch.object(main, "grafana_provisioning", provisioning), \
+                patch.dict(main.APP_CONFIG, {"grafanaHost": "http://grafana:3000"}), \
+                patch("app.commons.es_client.EsClient") as es_client:
+            es_client.return_value.create_grafana_data_source.return_value = True
+            main.provision_grafana()
+        assert provisioning.to_dict() == {"status": main.GrafanaProvisioning.DONE, "attempts": 1, "lastError": ""}
+        assert es_client.return_value.import_dashboard.call_count == len(main.GRAFANA_DASHBOARDS)
+
+    def test_health_status_does_not_depend_on_grafana(self):
+        with patch.dict(main.APP_CONFIG, {"grafanaHost": "http://grafana:3000", "amqpUrl": ""}), \
+                patch("app.commons.es_client.EsClient") as es_client, \
+                patch("app.commons.postgres_dao.PostgresDAO") as postgres_dao:
+            es_client.return_value.is_healthy.return_value = True
+            es_client.return_value.is_grafana_healthy.return_value = False
+            postgres_dao.return_value.test_query_handling.return_value = True
+            response = main.application.test_client().get("/")
+        assert response.status_code == 200
+        assert response.get_json()["status"] == "healthy"
+        assert "grafanaProvisioning" in response.get_json()
+        es_client.return_value.is_grafana_healthy.assert_not_called()
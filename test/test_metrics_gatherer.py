@@ -14,8 +14,13 @@
 
 import unittest
 import logging
+import threading
+import psycopg2
 from app.commons import metrics_gatherer
+from app.commons.activity_state import ActivityState, TransitionsRecorder
+from app.commons.activity_transitions import Transition, extract_transitions
 from datetime import datetime, date, timedelta
+from time import sleep
 from unittest.mock import MagicMock
 
 
@@ -43,6 +48,30 @@ class TestMetricsGatherer(unittest.TestCase):
             "esProjectIndexPrefix": "",
             "esUser": "",
             "esPassword": "",
+            "esTimePartitionedIndices": False,
+            "esBulkRefresh": "end_of_run",
+            "esBulkBatchSize": 2,
+            "esBulkBatchBytes": 5242880,
+            "esBulkQueueSize": 2,
+            "esBulkWorkers": 2,
+            "esBulkMaxRetries": 0,
+            "esAsyncConcurrency": 2,
+            "postgresUser": "",
+            "postgresPassword": "",
+            "postgresDatabase": "reportportal",
+            "postgresHost": "localhost",
+            "postgresPort": 5432,
+            "postgresPoolMinSize": 1,
+            "postgresPoolMaxSize": 10,
+            "postgresPoolTimeout": 60,
+            "postgresPoolValidationInterval": 30,
+            "postgresPoolIdleTimeout": 300,
+            "postgresQueryBatchSize": 1000,
+            "launchIdCacheSize": 1000,
+            "postgresCursorItersize": 100,
+            "postgresAsyncConcurrency": 2,
+            "incrementalActivityIngestion": False,
+            "dailyPartialAggregates": False,
             "autoAnalysisModelRemovePolicy": "",
             "suggestModelRemovePolicy": ""
         }
@@ -70,7 +99,7 @@ class TestMetricsGatherer(unittest.TestCase):
                 "details": {
                     "history": [
                         {"field": "issueType", "oldValue": "Automation Bug", "newValue": "System Issue"}]}
-            }], {"System Issue": "si001"}) == {
+            }], {"System Issue": "si001"}).to_dict() == {
                 1: [('analyze', 'Product Bug'), ('manual', 'Automation Bug', 'Product Bug')],
                 2: [('manual', 'si001', 'Automation Bug')]}
 
@@ -129,10 +158,15 @@ class TestMetricsGatherer(unittest.TestCase):
             'avg_processing_time_test_item_suggest': 0.08, 'percent_not_found_cluster': 17,
             'avg_processing_time_test_item_cluster': 0.13, 'model_info': ['global_model'],
             'module_version': ['1.1.1'], "launch_analyzed": 1, "errors": ["error 1"], "errors_count": 1}
+        activity_stats = _metrics_gatherer.collect_activity_stats(1, datetime(2020, 10, 13))
+        _metrics_gatherer.es_client.get_activities.reset_mock()
+        assert _metrics_gatherer.calculate_rp_stats_metrics(
+            {}, 1, datetime(2020, 10, 13), activity_stats=activity_stats)["launch_analyzed"] == 1
+        _metrics_gatherer.es_client.get_activities.assert_not_called()
 
     def test_calculate_metrics(self):
         _metrics_gatherer = metrics_gatherer.MetricsGatherer(self.get_app_config())
-        _metrics_gatherer.postgres_dao.get_launch_id = MagicMock(return_value=10)
+        _metrics_gatherer.postgres_dao.get_launch_ids = MagicMock(return_value={1: 10, 2: 10})
         assert _metrics_gatherer.calculate_metrics(
             {
                 1: [('analyze', 'Product Bug'), ('manual', 'Automation Bug', 'Product Bug')],
@@ -152,35 +186,11 @@ class TestMetricsGatherer(unittest.TestCase):
 
     def test_find_sequence_of_aa_enability(self):
         _metrics_gatherer = metrics_gatherer.MetricsGatherer(self.get_app_config())
-        _metrics_gatherer.postgres_dao.get_activities_by_project = MagicMock(return_value=[
-            {
-                "creation_date": datetime(2020, 10, 11),
-                "action": "updateAnalyzer",
-                "details": {
-                    "history": [
-                        {"field": "analyzer.isAutoAnalyzerEnabled", "oldValue": "true", "newValue": "false"}]}
-            },
-            {
-                "creation_date": datetime(2020, 10, 14),
-                "action": "updateAnalyzer",
-                "details": {
-                    "history": [
-                        {"field": "analyzer.isAutoAnalyzerEnabled", "oldValue": "false", "newValue": "true"}]}
-            },
-            {
-                "creation_date": datetime(2020, 10, 14),
-                "action": "updateAnalyzer",
-                "details": {
-                    "history": [
-                        {"field": "analyzer.isAutoAnalyzerEnabled", "oldValue": "true", "newValue": "false"}]}
-            },
-            {
-                "creation_date": datetime(2020, 10, 15),
-                "action": "updateAnalyzer",
-                "details": {
-                    "history": [
-                        {"field": "analyzer.isAutoAnalyzerEnabled", "oldValue": "false", "newValue": "true"}]}
-            }])
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project = MagicMock(return_value=iter([
+            Transition(1, 1, "updateAnalyzer", "false", "true", datetime(2020, 10, 11)),
+            Transition(2, 1, "updateAnalyzer", "true", "false", datetime(2020, 10, 14)),
+            Transition(3, 1, "updateAnalyzer", "false", "true", datetime(2020, 10, 14)),
+            Transition(4, 1, "updateAnalyzer", "true", "false", datetime(2020, 10, 15))]))
         assert _metrics_gatherer.find_sequence_of_aa_enability(1, datetime(2020, 10, 16), {}) == {
             date(2020, 10, 11): (0, 0), date(2020, 10, 14): (1, 0),
             date(2020, 10, 15): (1, 1)}
@@ -198,3 +208,187 @@ class TestMetricsGatherer(unittest.TestCase):
             {'gather_date': date(2020, 10, 14).strftime("%Y-%m-%d"), 'on': 0},
             {'gather_date': date(2020, 10, 15).strftime("%Y-%m-%d"), 'on': 1},
             {'gather_date': date(2020, 10, 16).strftime("%Y-%m-%d"), 'on': 0}]
+
+    def test_gather_metrics_by_project_with_prefetched_metadata(self):
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(self.get_app_config())
+        _metrics_gatherer.es_client.get_activities = MagicMock(return_value=[])
+        _metrics_gatherer.postgres_dao.is_auto_analysis_enabled_for_project = MagicMock(return_value=False)
+        _metrics_gatherer.postgres_dao.get_issue_type_dict = MagicMock(return_value={})
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project = MagicMock(return_value=iter([]))
+        _metrics_gatherer.postgres_dao.get_launch_ids = MagicMock(return_value={1: 10})
+        _metrics_gatherer.postgres_dao.count_unique_launches = MagicMock(return_value=2)
+        result = _metrics_gatherer.gather_metrics_by_project(
+            1, "project", datetime(2020, 10, 16), transitions=extract_transitions([
+                {
+                    "object_id": 1,
+                    "action": "analyzeItem",
+                    "details": {
+                        "history": [
+                            {"field": "issueType", "oldValue": "To Investigate", "newValue": "System Issue"}]}
+                }]), is_aa_enabled=True, issue_types_dict={"System Issue": "si001"})
+        _metrics_gatherer.postgres_dao.is_auto_analysis_enabled_for_project.assert_not_called()
+        _metrics_gatherer.postgres_dao.get_issue_type_dict.assert_not_called()
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project.assert_not_called()
+        assert result["on"] == 1
+        assert result["AA_analyzed"] == 1
+        assert result["launch_added"] == 2
+
+    def test_read_project_transitions_incrementally(self):
+        app_config = self.get_app_config()
+        app_config["incrementalActivityIngestion"] = True
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(app_config)
+        saved_transitions = [
+            Transition(3, 1, "analyzeItem", "Product Bug", "To Investigate", datetime(2020, 10, 7, 23)),
+            Transition(5, 1, "updateItem", "System Issue", "Product Bug", datetime(2020, 10, 9, 10))]
+        _metrics_gatherer.activity_state_store.load = MagicMock(
+            return_value=ActivityState(5, datetime(2020, 10, 7), saved_transitions))
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project = MagicMock(return_value=iter([
+            Transition(8, 2, "analyzeItem", "Automation Bug", "To Investigate", datetime(2020, 10, 15, 22), 4)]))
+        transitions = _metrics_gatherer.read_project_transitions(
+            1, datetime(2020, 10, 8, 22), datetime(2020, 10, 16, 22))
+        assert [transition.id for transition in transitions] == [5, 8]
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project.assert_called_once_with(
+            1, datetime(2020, 10, 8, 22), datetime(2020, 10, 16, 22), after_id=5)
+        assert transitions.get_state() == ActivityState(
+            8, datetime(2020, 10, 9), [saved_transitions[1], Transition(
+                8, 2, "analyzeItem", "Automation Bug", "To Investigate", datetime(2020, 10, 15, 22), 4)])
+
+    def test_backfill_keeps_saved_activity_state(self):
+        app_config = self.get_app_config()
+        app_config["incrementalActivityIngestion"] = True
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(app_config)
+        _metrics_gatherer.activity_state_store.load = MagicMock(return_value=ActivityState(
+            50, datetime(2020, 10, 9), [Transition(50, 1, "analyzeItem", "Product Bug", "To Investigate",
+                                                   datetime(2020, 10, 15))]))
+        backfill_transitions = iter([
+            Transition(8, 2, "analyzeItem", "Automation Bug", "To Investigate", datetime(2020, 9, 14))])
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project = MagicMock(return_value=backfill_transitions)
+        transitions = _metrics_gatherer.read_project_transitions(
+            1, datetime(2020, 9, 8), datetime(2020, 9, 16))
+        assert transitions is backfill_transitions
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project.assert_called_once_with(
+            1, datetime(2020, 9, 8), datetime(2020, 9, 16))
+
+    def test_prefetch_es_metadata(self):
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(self.get_app_config())
+        _metrics_gatherer.es_client.get_existing_ids = MagicMock(return_value={"1_2020-10-16"})
+        _metrics_gatherer.es_client.aggregate_activities = MagicMock(
+            side_effect=lambda start, end: {"1": {"methods": {}, "launch_analyzed": end.day}})
+        _metrics_gatherer.es_client.index_exists = MagicMock(side_effect=lambda index, print_error: index == "1")
+        gathered_row_ids, activity_stats_by_date, projects_with_index = _metrics_gatherer.prefetch_es_metadata(
+            [{"id": 1, "name": "project_1"}, {"id": 2, "name": "project_2"}],
+            [datetime(2020, 10, 15), datetime(2020, 10, 16)])
+        assert gathered_row_ids == {"1_2020-10-16"}
+        assert _metrics_gatherer.es_client.get_existing_ids.call_args[0][1] == [
+            "1_2020-10-15", "1_2020-10-16", "2_2020-10-15", "2_2020-10-16"]
+        assert activity_stats_by_date[datetime(2020, 10, 16)]["1"]["launch_analyzed"] == 17
+        assert projects_with_index == {1}
+        _metrics_gatherer.async_es_client.close()
+
+    def test_activity_stats_from_daily_partials(self):
+        app_config = self.get_app_config()
+        app_config["dailyPartialAggregates"] = True
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(app_config)
+        _metrics_gatherer.es_client.get_existing_ids = MagicMock(return_value=set())
+        _metrics_gatherer.es_client.aggregate_activities = MagicMock()
+        _metrics_gatherer.es_client.index_exists = MagicMock(return_value=True)
+        _, activity_stats_by_date, _ = _metrics_gatherer.prefetch_es_metadata(
+            [{"id": 1, "name": "project_1"}], [datetime(2020, 10, 16)])
+        _metrics_gatherer.es_client.aggregate_activities.assert_not_called()
+        assert activity_stats_by_date == {}
+        _metrics_gatherer.daily_partials.get_window_stats = MagicMock(
+            return_value={"1": {"methods": {}, "launch_analyzed": 1, "launch_added": 3}})
+        assert _metrics_gatherer.get_projects_activity_stats(
+            datetime(2020, 10, 16), activity_stats_by_date)["1"]["launch_added"] == 3
+        _metrics_gatherer.daily_partials.get_window_stats.assert_called_once_with(datetime(2020, 10, 16))
+        _metrics_gatherer.postgres_dao.get_launch_ids = MagicMock(return_value={})
+        _metrics_gatherer.postgres_dao.count_unique_launches = MagicMock()
+        result = _metrics_gatherer.gather_metrics_by_project(
+            1, "project_1", datetime(2020, 10, 16), transitions=[], is_aa_enabled=True, issue_types_dict={},
+            activity_stats=activity_stats_by_date[datetime(2020, 10, 16)]["1"], launch_added=3)
+        _metrics_gatherer.postgres_dao.count_unique_launches.assert_not_called()
+        assert result["launch_added"] == 3
+        assert result["launch_analyzed"] == 1
+        _metrics_gatherer.async_es_client.close()
+
+    def test_failed_transitions_stream_fails_project(self):
+        app_config = self.get_app_config()
+        app_config["incrementalActivityIngestion"] = True
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(app_config)
+        _metrics_gatherer.prefetch_projects_metadata = MagicMock(
+            return_value=([{"id": 1, "name": "project_1"}], {1: True}, {1: {}}))
+        _metrics_gatherer.prefetch_es_metadata = MagicMock(
+            return_value=(set(), {datetime(2020, 10, 16): {}}, {1}))
+        _metrics_gatherer.activity_state_store.load = MagicMock(return_value=None)
+        _metrics_gatherer.activity_state_store.save = MagicMock()
+        _metrics_gatherer.bulk_writer.bulk_index = MagicMock()
+
+        def broken_stream():
+            yield Transition(3, 1, "analyzeItem", "Product Bug", "To Investigate", datetime(2020, 10, 15), 10)
+            raise psycopg2.OperationalError("canceling statement due to statement timeout")
+
+        _metrics_gatherer.postgres_dao.iter_transitions_by_project = MagicMock(return_value=broken_stream())
+        _metrics_gatherer.gather_metrics(datetime(2020, 10, 16), datetime(2020, 10, 16))
+        _metrics_gatherer.bulk_writer.bulk_index.assert_not_called()
+        _metrics_gatherer.activity_state_store.save.assert_not_called()
+
+    def test_unreadable_projects_fail_gathering(self):
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(self.get_app_config())
+        _metrics_gatherer.postgres_dao.query_db = MagicMock(return_value=None)
+        _metrics_gatherer.prefetch_es_metadata = MagicMock()
+        assert _metrics_gatherer.gather_metrics(datetime(2020, 10, 16), datetime(2020, 10, 16)) is False
+        _metrics_gatherer.prefetch_es_metadata.assert_not_called()
+
+    def test_projects_are_gathered_in_parallel(self):
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(self.get_app_config())
+        _metrics_gatherer.prefetch_projects_metadata = MagicMock(return_value=(
+            [{"id": project_id, "name": "project_%d" % project_id} for project_id in range(1, 5)], {1: True}, {}))
+        _metrics_gatherer.prefetch_es_metadata = MagicMock(
+            return_value=({"4_2020-10-16"}, {datetime(2020, 10, 16): {}}, {1, 2, 3, 4}))
+        _metrics_gatherer.models_remover.get_policies_metrics = MagicMock(return_value={})
+        _metrics_gatherer.models_remover.apply_remove_model_policies = MagicMock()
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def gather_project_metrics(project_info, *args, **kwargs):
+            with lock:
+                running.append(project_info["id"])
+                max_running.append(len(running))
+            sleep(0.05)
+            with lock:
+                running.remove(project_info["id"])
+            return project_info["id"] != 3
+
+        _metrics_gatherer.gather_project_metrics = MagicMock(side_effect=gather_project_metrics)
+        # the workers are started again by the next run of the same gatherer
+        for _ in range(2):
+            assert _metrics_gatherer.gather_metrics(datetime(2020, 10, 16), datetime(2020, 10, 16))
+        assert max(max_running) == 2
+        assert _metrics_gatherer.gather_project_metrics.call_count == 6
+        first_call = _metrics_gatherer.gather_project_metrics.call_args_list[0]
+        assert first_call[0][2] == [datetime(2020, 10, 16)]
+        assert first_call[1]["is_aa_enabled"] is True
+        apply_policies = _metrics_gatherer.models_remover.apply_remove_model_policies
+        assert [call[0][0] for call in apply_policies.call_args_list] == [1, 2, 1, 2]
+
+    def test_project_reads_go_through_async_es_client(self):
+        app_config = self.get_app_config()
+        app_config["incrementalActivityIngestion"] = True
+        _metrics_gatherer = metrics_gatherer.MetricsGatherer(app_config)
+        _metrics_gatherer.prefetch_projects_metadata = MagicMock(return_value=(
+            [{"id": 1, "name": "project_1"}, {"id": 2, "name": "project_2"}], {}, {}))
+        # the batch check of the gathered rows failed
+        _metrics_gatherer.prefetch_es_metadata = MagicMock(
+            return_value=(None, {datetime(2020, 10, 16): {}}, {1, 2}))
+        _metrics_gatherer.es_client.object_exists = MagicMock(
+            side_effect=lambda index, row_id: row_id == "2_2020-10-16")
+        _metrics_gatherer.activity_state_store.load = MagicMock(return_value=None)
+        _metrics_gatherer.gather_project_metrics = MagicMock(return_value=False)
+        for _ in range(2):
+            assert _metrics_gatherer.gather_metrics(datetime(2020, 10, 16), datetime(2020, 10, 16))
+        assert _metrics_gatherer.es_client.object_exists.call_count == 4
+        assert [call[0][0] for call in _metrics_gatherer.activity_state_store.load.call_args_list] == [1, 1]
+        project_info, transitions = _metrics_gatherer.gather_project_metrics.call_args[0][:2]
+        assert project_info["id"] == 1
+        assert isinstance(transitions, TransitionsRecorder)
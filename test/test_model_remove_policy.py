@@ -0,0 +1,101 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from app.commons.model_remove_policy.auto_analysis_model_remove_policy import AutoAnalysisModelRemovePolicy
+from app.commons.model_remove_policy.suggest_model_remove_policy import SuggestModelRemovePolicy
+
+
+class TestModelRemovePolicy(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_app_config(self):
+        return {
+            "esHost": "http://localhost:9200",
+            "grafanaHost": "",
+            "turnOffSslVerification": False,
+            "esVerifyCerts": False,
+            "esUseSsl": False,
+            "esSslShowWarn": False,
+            "esCAcert": "",
+            "esClientCert": "",
+            "esClientKey": "",
+            "esUser": "",
+            "esPassword": "",
+            "esTimePartitionedIndices": False,
+            "esBulkWorkers": 2,
+            "esAsyncConcurrency": 2,
+            "autoAnalysisModelRemovePolicy": "f1-score<=80|percent_not_found_aa>70",
+            "suggestModelRemovePolicy": "reciprocalRank<=80|notFoundResults>70"
+        }
+
+    def test_aggregated_metrics_are_checked_like_documents(self):
+        policy = AutoAnalysisModelRemovePolicy(self.get_app_config())
+        policy.es_client.es_client = MagicMock()
+        policy.es_client.es_client.search.side_effect = [
+            {"aggregations": {"buckets": {"after_key": {"project": "1"}, "buckets": [{
+                "key": {"project": "1"}, "doc_count": 2,
+                "condition_0": {"value": 82.5}, "condition_1": {"value": None},
+                "module_version": {"buckets": [{"key": "1.1.1", "doc_count": 2}]}}]}}},
+            {"aggregations": {"buckets": {"buckets": []}}}]
+        projects_metrics = policy.get_projects_metrics(datetime(2020, 10, 9), datetime(2020, 10, 17))
+        body = policy.es_client.es_client.search.call_args_list[0][1]["body"]
+        assert body["aggs"]["buckets"]["aggs"]["condition_0"]["scripted_metric"]["params"] == {"field": "f1-score"}
+        assert policy.check_project_metrics(projects_metrics["1"]) == policy.check_metrics({"hits": {"hits": [
+            {"_source": {"f1-score": 80, "module_version": ["1.1.1"]}},
+            {"_source": {"f1-score": 85, "module_version": ["1.1.1"]}}]}}) == (False, [("f1-score", 82.5)], ["1.1.1"])
+        assert policy.check_project_metrics(projects_metrics.get("2")) == (False, [], [])
+
+    def test_suggest_policy_aggregates_by_project(self):
+        policy = SuggestModelRemovePolicy(self.get_app_config())
+        policy.es_client.es_client = MagicMock()
+        policy.es_client.es_client.search.return_value = {"aggregations": {"buckets": {"buckets": [{
+            "key": {"project": "3"}, "doc_count": 4,
+            "condition_0": {"value": 50.0}, "condition_1": {"value": 75.123},
+            "module_version": {"buckets": []}}]}}}
+        projects_metrics = policy.get_projects_metrics(datetime(2020, 10, 9), datetime(2020, 10, 17))
+        body = policy.es_client.es_client.search.call_args[1]["body"]
+        assert body["aggs"]["buckets"]["composite"]["sources"] == [{"project": {"terms": {"field": "project"}}}]
+        assert "savedDate" in body["query"]["bool"]["filter"][0]["range"]
+        assert policy.check_project_metrics(projects_metrics["3"]) == (
+            True, [("reciprocalRank", 50.0), ("notFoundResults", 75.12)], [])
+
+    def test_means_are_calculated_from_stored_values(self):
+        app_config = self.get_app_config()
+        app_config["autoAnalysisModelRemovePolicy"] = "f1-score<=42.5"
+        policy = AutoAnalysisModelRemovePolicy(app_config)
+        policy.es_client.es_client = MagicMock()
+        # f1-score is stored as round(x, 2) * 100, which the integer doc values would truncate to 56 and 28
+        stored_scores = [round(0.57, 2) * 100, round(0.29, 2) * 100]
+        assert stored_scores == [56.99999999999999, 28.999999999999996]
+        policy.es_client.es_client.search.return_value = {"aggregations": {"buckets": {"buckets": [{
+            "key": {"project": "1"}, "doc_count": 2,
+            "condition_0": {"value": sum(stored_scores) / len(stored_scores)},
+            "module_version": {"buckets": []}}]}}}
+        projects_metrics = policy.get_projects_metrics(datetime(2020, 10, 9), datetime(2020, 10, 17))
+        body = policy.es_client.es_client.search.call_args[1]["body"]
+        scripted_metric = body["aggs"]["buckets"]["aggs"]["condition_0"]["scripted_metric"]
+        assert "params._source[params.field]" in scripted_metric["map_script"]
+        assert "avg" not in body["aggs"]["buckets"]["aggs"]["condition_0"]
+        assert policy.check_project_metrics(projects_metrics["1"]) == policy.check_metrics({"hits": {"hits": [
+            {"_source": {"f1-score": score}} for score in stored_scores]}}) == (False, [("f1-score", 43.0)], [])
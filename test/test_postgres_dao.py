@@ -0,0 +1,298 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+import logging
+import threading
+import unittest
+from datetime import date, datetime
+from time import sleep, time
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from app.commons import postgres_dao
+from app.commons.activity_transitions import Transition
+from app.commons.async_postgres_dao import AsyncPostgresDAO
+from app.commons.row_factory import get_row_class
+
+
+class TestPostgresConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_app_config(self, min_size=1, max_size=2):
+        return {
+            "postgresUser": "",
+            "postgresPassword": "",
+            "postgresDatabase": "reportportal",
+            "postgresHost": "localhost",
+            "postgresPort": 5432,
+            "postgresPoolMinSize": min_size,
+            "postgresPoolMaxSize": max_size,
+            "postgresPoolTimeout": 0,
+            "postgresPoolValidationInterval": 30,
+            "postgresPoolIdleTimeout": 300,
+            "postgresQueryBatchSize": 1000,
+            "launchIdCacheSize": 1000,
+            "postgresCursorItersize": 100,
+            "postgresAsyncConcurrency": 2
+        }
+
+    @staticmethod
+    def create_connection(*args, **kwargs):
+        connection = MagicMock()
+        connection.closed = 0
+        connection.created_at = time()
+        connection.last_used_at = connection.created_at
+        connection.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        connection.prepared_statements = set()
+        return connection
+
+    def test_connection_is_reused(self):
+        pool = postgres_dao.PostgresConnectionPool(self.get_app_config())
+        with patch("psycopg2.connect", side_effect=self.create_connection) as connect:
+            with pool.connection() as first_connection:
+                pass
+            with pool.connection() as second_connection:
+                pass
+        assert first_connection is second_connection
+        assert connect.call_count == 1
+        stats = pool.get_stats()
+        assert stats["checkouts"] == 2
+        assert stats["connections_created"] == 1
+        assert stats["idle"] == 1
+        assert stats["in_use"] == 0
+
+    def test_broken_connection_is_replaced(self):
+        pool = postgres_dao.PostgresConnectionPool(self.get_app_config())
+        calls = []
+
+        def callback(connection):
+            calls.append(connection)
+            if len(calls) == 1:
+                raise psycopg2.OperationalError("server closed the connection unexpectedly")
+            return "result"
+
+        with patch("psycopg2.connect", side_effect=self.create_connection):
+            assert pool.execute(callback) == "result"
+        assert calls[0] is not calls[1]
+        stats = pool.get_stats()
+        assert stats["reconnects"] == 1
+        assert stats["connections_closed"] == 1
+
+    def test_max_size_is_respected(self):
+        pool = postgres_dao.PostgresConnectionPool(self.get_app_config(max_size=1))
+        with patch("psycopg2.connect", side_effect=self.create_connection):
+            with pool.connection():
+                with self.assertRaises(psycopg2.pool.PoolError):
+                    pool.getconn()
+        assert pool.get_stats()["timeouts"] == 1
+
+    def test_idle_connections_are_kept_until_idle_timeout(self):
+        app_config = self.get_app_config(min_size=1, max_size=3)
+        pool = postgres_dao.PostgresConnectionPool(app_config)
+        with patch("psycopg2.connect", side_effect=self.create_connection) as connect:
+            for _ in range(2):
+                with pool.connection(), pool.connection(), pool.connection():
+                    pass
+        assert connect.call_count == 3
+        assert pool.get_stats()["idle"] == 3
+        for connection in pool._idle:
+            connection.last_used_at -= 301
+        with patch("psycopg2.connect", side_effect=self.create_connection):
+            with pool.connection():
+                pass
+        stats = pool.get_stats()
+        assert stats["idle"] == 1
+        assert stats["size"] == 1
+        assert stats["connections_closed"] == 2
+
+
+class TestPostgresDAO(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_app_config(self):
+        return {
+            "postgresUser": "",
+            "postgresPassword": "",
+            "postgresDatabase": "reportportal",
+            "postgresHost": "localhost",
+            "postgresPort": 5432,
+            "postgresPoolMinSize": 1,
+            "postgresPoolMaxSize": 2,
+            "postgresPoolTimeout": 0,
+            "postgresPoolValidationInterval": 30,
+            "postgresPoolIdleTimeout": 300,
+            "postgresQueryBatchSize": 2,
+            "launchIdCacheSize": 1000,
+            "postgresCursorItersize": 100,
+            "postgresAsyncConcurrency": 2
+        }
+
+    def test_get_launch_ids(self):
+        launches = {1: 10, 2: 10, 3: 11}
+        with patch.object(postgres_dao.PostgresDAO, "query_db", return_value=None):
+            _postgres_dao = postgres_dao.PostgresDAO(self.get_app_config())
+        _postgres_dao.query_db = MagicMock(side_effect=lambda statement_name, params: [
+            {"item_id": item_id, "launch_id": launch_id} for item_id, launch_id in launches.items()
+            if item_id in params[0]])
+        assert _postgres_dao.get_launch_ids([1, 2, 3, 3]) == {1: 10, 2: 10, 3: 11}
+        assert _postgres_dao.query_db.call_count == 2
+        assert _postgres_dao.get_launch_ids([1, 4]) == {1: 10, 4: None}
+        assert _postgres_dao.query_db.call_count == 3
+        assert _postgres_dao.get_launch_id(4) is None
+        assert _postgres_dao.query_db.call_count == 3
+
+    def test_count_launches_by_day(self):
+        with patch.object(postgres_dao.PostgresDAO, "query_db", return_value=None):
+            _postgres_dao = postgres_dao.PostgresDAO(self.get_app_config())
+        self.addCleanup(_postgres_dao.pool.close_all)
+        row_class = get_row_class(("project_id", "start_date", "launches"))
+        _postgres_dao.query_db = MagicMock(return_value=[
+            row_class(1, date(2020, 10, 16), 3), row_class(2, date(2020, 10, 16), 1)])
+        assert _postgres_dao.count_launches_by_day(datetime(2020, 10, 16), datetime(2020, 10, 17)) == {
+            (1, date(2020, 10, 16)): 3, (2, date(2020, 10, 16)): 1}
+        _postgres_dao.query_db.return_value = None
+        assert _postgres_dao.count_launches_by_day(datetime(2020, 10, 16), datetime(2020, 10, 17)) is None
+
+    def test_stream_query(self):
+        with patch.object(postgres_dao.PostgresDAO, "query_db", return_value=None):
+            _postgres_dao = postgres_dao.PostgresDAO(self.get_app_config())
+        self.addCleanup(_postgres_dao.pool.close_all)
+        connection = TestPostgresConnectionPool.create_connection()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.__iter__.return_value = iter([(1, "project_1"), (2, "project_2")])
+        cursor.description = (("id", 20), ("name", 1043))
+        with patch("psycopg2.connect", return_value=connection):
+            rows = _postgres_dao.stream_query("get_all_projects")
+            row = next(rows)
+            assert (row["id"], row.name) == (1, "project_1")
+            assert [tuple(row) for row in rows] == [(2, "project_2")]
+        assert cursor.itersize == 100
+        assert connection.cursor.call_args[1]["name"].startswith("metrics_gatherer_")
+
+    def test_stream_query_error_is_raised(self):
+        with patch.object(postgres_dao.PostgresDAO, "query_db", return_value=None):
+            _postgres_dao = postgres_dao.PostgresDAO(self.get_app_config())
+        self.addCleanup(_postgres_dao.pool.close_all)
+        connection = TestPostgresConnectionPool.create_connection()
+        cursor = connection.cursor.return_value.__enter__.return_value
+
+        def broken_stream():
+            yield (1, "project_1")
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+        cursor.__iter__.return_value = broken_stream()
+        cursor.description = (("id", 20), ("name", 1043))
+        with patch("psycopg2.connect", return_value=connection):
+            rows = _postgres_dao.stream_query("get_all_projects")
+            assert next(rows)["id"] == 1
+            with self.assertRaises(psycopg2.OperationalError):
+                next(rows)
+
+    def test_iter_transitions_by_project(self):
+        with patch.object(postgres_dao.PostgresDAO, "query_db", return_value=None):
+            _postgres_dao = postgres_dao.PostgresDAO(self.get_app_config())
+        self.addCleanup(_postgres_dao.pool.close_all)
+        _postgres_dao.stream_query = MagicMock(return_value=iter([
+            (3, 1, "analyzeItem", "Product Bug", "To Investigate", datetime(2020, 10, 7), 10)]))
+        transitions = list(_postgres_dao.iter_transitions_by_project(
+            1, datetime(2020, 10, 1), datetime(2020, 10, 8), after_id=2))
+        assert transitions == [Transition(
+            3, 1, "analyzeItem", "Product Bug", "To Investigate", datetime(2020, 10, 7), 10)]
+        assert transitions[0].launch_id == 10
+        _postgres_dao.stream_query.assert_called_once_with(
+            "get_transitions_by_project_after_id",
+            (1, datetime(2020, 10, 1), datetime(2020, 10, 8), 2), derive_scheme=False)
+
+    def test_statement_queries(self):
+        statement = postgres_dao.STATEMENTS["get_all_unique_launch_ids"]
+        assert statement.prepare_query.startswith(
+            "PREPARE get_all_unique_launch_ids (bigint, timestamp, timestamp) AS select id from launch")
+        assert "project_id = $1 and start_time >= $2" in statement.prepare_query
+        assert statement.prepare_query.endswith("start_time <= $3")
+        assert statement.execute_query == "EXECUTE get_all_unique_launch_ids (%s, %s, %s)"
+        assert postgres_dao.STATEMENTS["get_all_projects"].execute_query == "EXECUTE get_all_projects"
+        for statement_name in ["get_transitions_by_project", "get_transitions_by_project_after_id"]:
+            # untracked activities are filtered out before their history is unnested
+            assert "and a.action in ('analyzeItem', 'updateItem', 'updateAnalyzer') and (" in \
+                postgres_dao.STATEMENTS[statement_name].query
+
+    def test_statement_is_prepared_once_per_connection(self):
+        connection = TestPostgresConnectionPool.create_connection()
+        cursor = connection.cursor.return_value
+        cursor.connection = connection
+        statement = postgres_dao.STATEMENTS["get_launch_ids"]
+        postgres_dao.execute_statement(cursor, statement, ([1, 2],))
+        postgres_dao.execute_statement(cursor, statement, ([3],))
+        assert [call[0] for call in cursor.execute.call_args_list] == [
+            (statement.prepare_query,),
+            ("EXECUTE get_launch_ids (%s)", ([1, 2],)),
+            ("EXECUTE get_launch_ids (%s)", ([3],))]
+
+
+class TestAsyncPostgresDAO(unittest.TestCase):
+
+    def get_app_config(self):
+        return {"postgresAsyncConcurrency": 2}
+
+    def test_queries_run_with_bounded_concurrency(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def get_issue_type_dict(project_id):
+            with lock:
+                running.append(project_id)
+                max_running.append(len(running))
+            sleep(0.05)
+            with lock:
+                running.remove(project_id)
+            return {"Product Bug": "pb%03d" % project_id}
+
+        dao = MagicMock()
+        dao.get_issue_type_dict = MagicMock(side_effect=get_issue_type_dict)
+        async_dao = AsyncPostgresDAO(self.get_app_config(), dao=dao)
+        self.addCleanup(async_dao.close)
+
+        async def get_all():
+            return await asyncio.gather(*[async_dao.get_issue_type_dict(project_id) for project_id in range(5)])
+
+        assert asyncio.run(get_all()) == [{"Product Bug": "pb%03d" % project_id} for project_id in range(5)]
+        assert max(max_running) == 2
+
+    def test_iter_activities_by_project(self):
+        dao = MagicMock()
+        dao.cursor_itersize = 2
+        dao.iter_activities_by_project = MagicMock(
+            side_effect=lambda *args, **kwargs: (row for row in [{"object_id": i} for i in range(5)]))
+        async_dao = AsyncPostgresDAO(self.get_app_config(), dao=dao)
+        self.addCleanup(async_dao.close)
+
+        async def read_all():
+            return [row async for row in async_dao.iter_activities_by_project(1, None, None)]
+
+        assert asyncio.run(read_all()) == [{"object_id": i} for i in range(5)]
@@ -0,0 +1,45 @@
+#  Copyright 2023 EPAM Systems
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from app.commons import row_factory
+
+
+class TestRowFactory(unittest.TestCase):
+
+    description = (("object_id", 20), ("action", 1043), ("?column?", 23))
+
+    def test_named_tuple_rows(self):
+        create_row = row_factory.create_row_factory(self.description, row_factory.NAMED_TUPLE)
+        row = create_row((1, "analyzeItem", 5))
+        assert row["object_id"] == row.object_id == row[0] == 1
+        assert row["action"] == "analyzeItem"
+        assert row["_2"] == 5
+        assert row.keys() == ("object_id", "action", "_2")
+        assert tuple(row) == (1, "analyzeItem", 5)
+
+    def test_slots_rows(self):
+        create_row = row_factory.create_row_factory(self.description, row_factory.SLOTS)
+        row = create_row((1, "analyzeItem", 5))
+        assert not hasattr(row, "__dict__")
+        assert row["object_id"] == row.object_id == row[0] == 1
+        assert row[1] == row["action"] == "analyzeItem"
+        assert tuple(row) == (1, "analyzeItem", 5)
+        assert len(row) == 3
+        assert row == create_row((1, "analyzeItem", 5))
+
+    def test_row_classes_are_reused(self):
+        assert row_factory.create_row_factory(self.description, row_factory.SLOTS) is \
+            row_factory.create_row_factory(list(self.description), row_factory.SLOTS)